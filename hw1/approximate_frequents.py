@@ -1,86 +1,451 @@
 #!/usr/bin/env python3
 
+import argparse
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from approximate_occurrences import neighbourhood_size
+from count_min_sketch import SKETCH_DEPTH, SKETCH_WIDTH, CountMinSketch
+from kmer_encoding import DENSE_K_MAX, DENSE_SPARSITY_MAX, encode_genome, count_kmer_codes, mismatch_masks, \
+    kmer_counter, most_frequent_codes, decode_kmer
+from kmer_index import KMER_K_MAX, KmerIndex, kmer_code_array, load_or_build_index
+from neighbourhood import generate_neighbours
+from result_writer import write_items
+
 
 def main():
+    parser = argparse.ArgumentParser(description='Find most frequent k-mers with mismatches')
+    parser.add_argument(
+        '--algorithm', choices=['packed', 'trie'], default='packed',
+        help="'packed' expands neighbourhoods of all k-mers one by one; 'trie' walks a k-mer trie with a mismatch "
+             "budget and counts whole subtrees at once, which is several times faster"
+    )
+    parser.add_argument(
+        '--kmer-index',
+        help='count k-mers with the k-mer index file at this path, built (or rebuilt if the genome or k changed) on demand'
+    )
+    parser.add_argument(
+        '--sketch', action='store_true',
+        help='count approximately in fixed memory with a count-min sketch; candidates are then counted exactly. '
+             'Meant for large k, where exact counters do not fit into memory'
+    )
+    parser.add_argument('--sketch-width', type=int, default=SKETCH_WIDTH, help='number of counters in a sketch row')
+    parser.add_argument('--sketch-depth', type=int, default=SKETCH_DEPTH, help='number of sketch rows')
+    parser.add_argument(
+        '--heavy-hitters', type=int, default=HEAVY_HITTERS, help='number of candidates to count exactly'
+    )
+    args = parser.parse_args()
+
     genome = input().upper()
     k, mismatches = list(map(int, input().split()))
+    if args.kmer_index is not None and k > KMER_K_MAX:
+        print('The k-mer index supports k up to {}, scanning the genome instead'.format(KMER_K_MAX), file=sys.stderr)
+        args.kmer_index = None
+    if args.sketch and k > KMER_K_MAX:
+        print('The sketch mode supports k up to {}, counting exactly instead'.format(KMER_K_MAX), file=sys.stderr)
+        args.sketch = False
+
+    if args.sketch:
+        sketched = sketch_frequent_words_with_mismatches(
+            genome, k, mismatches, args.sketch_width, args.sketch_depth, args.heavy_hitters
+        )
+        frequents = sketched.words
+        print(
+            'Counted {} candidates exactly, the most frequent occur {} times; sketch estimates exceed true counts by '
+            'at most {:.1f} with probability {:.4f}'.format(
+                sketched.candidates, sketched.count, sketched.error, sketched.confidence
+            ),
+            file=sys.stderr
+        )
+    elif args.kmer_index is not None:
+        frequents = indexed_frequent_words_with_mismatches(load_or_build_index(args.kmer_index, genome, k), mismatches)
+    elif args.algorithm == 'trie':
+        stats = {}
+        frequents = frequent_words_with_mismatches_trie(genome, k, mismatches, stats)
+        print(
+            'Scored {} candidates, pruned {} candidate prefixes'.format(stats['scored'], stats['pruned']),
+            file=sys.stderr
+        )
+    else:
+        frequents = frequent_words_with_mismatches(genome, k, mismatches)
+    write_items(frequents)
+
+
+def _frequent_words_with_mismatches_strings(genome: str, k: int, mismatches: int) -> list:
+    """
+    Find most frequent patterns of length 'k' in 'genome' with at most 'mismatches' mismatches, counting string
+    neighbourhoods. Used for genomes which contain characters other than 'A', 'C', 'G', 'T'
+    """
+    frequencies = {}
+
+    for sstart in range(len(genome) - k + 1):
+        sequence = genome[sstart:sstart + k]
+        for neighbour in generate_neighbours(sequence, mismatches):
+            frequencies[neighbour] = frequencies.get(neighbour, 0) + 1
+
+    max_frequency = max(frequencies.values())
+
+    result = []
+    for pattern, frequency in frequencies.items():
+        if frequency == max_frequency:
+            result.append(pattern)
+
+    return result
+
 
-    frequents = frequent_words_with_mismatches(genome, k, mismatches)
-    for word in frequents:
-        print(word, end=' ')
-    print()
+def frequent_words_with_mismatches(genome: str, k: int, mismatches: int, dense_k_max: int = DENSE_K_MAX) -> list:
+    """
+    Find most frequent patterns of length 'k' in 'genome' with at most 'mismatches' mismatches.
 
+    The genome is encoded into 2-bit codes once; each distinct k-mer of it adds its number of occurrences to all its
+    neighbours, obtained as 'code ^ mask' for precomputed XOR masks
+    :param genome: genome to examine
+    :param k: pattern length
+    :param mismatches: maximum number of mismatches
+    :param dense_k_max: largest 'k' to count patterns in a flat array of 4**k cells (if the genome is large enough, see
+    'kmer_counter()'); a sparse dict is used above it
+    :return: a list of patterns, sorted
+    """
+    try:
+        codes = encode_genome(genome)
+    except ValueError:
+        return sorted(_frequent_words_with_mismatches_strings(genome, k, mismatches))
 
-LIST_A = ['C', 'T', 'G']
-LIST_C = ['A', 'T', 'G']
-LIST_T = ['C', 'A', 'G']
-LIST_G = ['C', 'T', 'A']
+    return _frequent_words_from_counts(count_kmer_codes(codes, k).items(), k, mismatches, dense_k_max)
 
 
-def _generate_immediate_neighbours(pattern: str) -> list:
+def _frequent_words_from_counts(kmer_counts, k: int, mismatches: int, dense_k_max: int) -> list:
     """
-    Generate immediate (different by one mismatch) neighbours of the given genome pattern
-    :param pattern: a pattern to examine
-    :return: neighbourhood, NOT including the given pattern
+    Find most frequent patterns with at most 'mismatches' mismatches, given counts of distinct k-mers
+    :param kmer_counts: an iterable of (k-mer code, number of occurrences)
+    :return: a list of patterns, sorted
     """
-    generated = []
-    for i in range(len(pattern)):
-        if pattern[i] == 'A':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_A])
-        elif pattern[i] == 'C':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_C])
-        elif pattern[i] == 'T':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_T])
-        elif pattern[i] == 'G':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_G])
+    kmer_counts = list(kmer_counts)
+    masks = mismatch_masks(k, mismatches)
+    frequencies = kmer_counter(k, dense_k_max, len(kmer_counts) * len(masks))
+
+    for code, count in kmer_counts:
+        for mask in masks:
+            frequencies[code ^ mask] += count
 
-    return generated
+    return [decode_kmer(code, k) for code in most_frequent_codes(frequencies)]
 
 
-def generate_neighbours(pattern: str, mismatches: int) -> set:
+def indexed_frequent_words_with_mismatches(index: KmerIndex, mismatches: int, dense_k_max: int = DENSE_K_MAX) -> list:
     """
-    Generate neighbours for the given pattern (genome string)
-    :param pattern: genome pattern
-    :param mismatches: number of mismatches to generate neighbours
-    :return: a set of patterns in the neighbourhood, including the 'pattern' itself
+    Find most frequent patterns of length 'index.k' with at most 'mismatches' mismatches in the genome of a k-mer index,
+    without scanning the genome. K-mers containing characters other than 'A', 'C', 'G', 'T' are not counted
+    :return: a list of patterns, sorted
     """
-    neighbourhood = set()
-    neighbourhood.add(pattern)
+    return _frequent_words_from_counts(index.kmer_counts(), index.k, mismatches, dense_k_max)
 
-    curr_patterns = [pattern]
-    next_patterns = []
 
-    for curr_mismatches in range(mismatches):
-        for curr_pattern in curr_patterns:
-            for neighbour in _generate_immediate_neighbours(curr_pattern):
-                if neighbour not in neighbourhood:
-                    neighbourhood.add(neighbour)
-                    next_patterns.append(neighbour)
+# Default number of candidates counted exactly in the sketch mode
+HEAVY_HITTERS = 1024
 
-        curr_patterns = next_patterns
-        next_patterns = []
+# Number of k-mers processed at once in the sketch mode
+SKETCH_CHUNK_SIZE = 1 << 16
 
-    return neighbourhood
+# Number of low bits of codes in the bitmap which filters neighbours before they are looked up in the heavy-hitter table
+SKETCH_FILTER_BITS = 20
 
+SketchedFrequents = namedtuple('SketchedFrequents', ['words', 'count', 'candidates', 'error', 'confidence'])
 
-def frequent_words_with_mismatches(genome: str, k: int, mismatches: int) -> list:
-    frequencies = {}
 
-    for sstart in range(len(genome) - k + 1):
-        sequence = genome[sstart:sstart + k]
-        neighbours = list(generate_neighbours(sequence, mismatches))
-        for neighbour in neighbours:
-            frequencies[neighbour] = frequencies.get(neighbour, 0) + 1
+def _iter_kmer_code_chunks(data: bytes, k: int, chunk_size: int):
+    for start in range(0, max(len(data) - k + 1, 0), chunk_size):
+        yield kmer_code_array(data[start:start + chunk_size + k - 1], k)[1]
 
-    max_frequency = max(frequencies.values())
 
+def _top_estimates(sketch: CountMinSketch, table: np.ndarray, pending: list, capacity: int) -> tuple:
+    """
+    Merge new candidates into the heavy-hitter table, keeping at most 'capacity' codes with the largest estimates
+    :return: the new table and the estimate a new candidate must exceed to get into it
+    """
+    candidates = np.unique(np.concatenate([table] + pending))
+    if len(candidates) <= capacity:
+        return candidates, 0
+    estimates = sketch.estimate(candidates)
+    top = np.argpartition(estimates, len(candidates) - capacity)[len(candidates) - capacity:]
+    return candidates[top], int(estimates[top].min())
+
+
+def sketch_frequent_words_with_mismatches(genome: str, k: int, mismatches: int, width: int = SKETCH_WIDTH,
+                                          depth: int = SKETCH_DEPTH, heavy_hitters: int = HEAVY_HITTERS,
+                                          chunk_size: int = SKETCH_CHUNK_SIZE) -> SketchedFrequents:
+    """
+    Find candidate most frequent patterns of length 'k' in 'genome' with at most 'mismatches' mismatches, in memory
+    which does not depend on the genome size.
+
+    Neighbours of all k-mers are counted approximately in a count-min sketch. A table of at most 'heavy_hitters' codes
+    with the largest estimates is kept on the way; in a second pass over the genome these candidates are counted
+    exactly. A pattern which never gets into the table is not reported. K-mers containing characters other than 'A',
+    'C', 'G', 'T' are not counted.
+
+    Both passes hold the sketch ('width' * 'depth' counters), the table, the XOR masks of the neighbourhood (one per
+    neighbour of a k-mer, see 'mismatch_masks()') and one chunk of k-mers with their neighbours by one mask
+    :param genome: genome to examine
+    :param k: pattern length, at most KMER_K_MAX
+    :param mismatches: maximum number of mismatches
+    :param width: number of counters in a sketch row
+    :param depth: number of sketch rows
+    :param heavy_hitters: number of candidates to count exactly
+    :param chunk_size: number of k-mers processed at once
+    :return: the sorted candidates with the maximum exact count, the count, the number of candidates, and the maximum
+    overcount of sketch estimates with the probability it holds
+    """
+    if k > KMER_K_MAX:
+        raise ValueError('The sketch mode supports k up to {}, got {}'.format(KMER_K_MAX, k))
+
+    data = genome.encode('ascii')
+    masks = np.array(mismatch_masks(k, mismatches), dtype=np.uint64)
+    sketch = CountMinSketch(width, depth)
+
+    table = np.zeros(0, dtype=np.uint64)
+    threshold = 0
+    pending = []
+    pending_size = 0
+    for codes in _iter_kmer_code_chunks(data, k, chunk_size):
+        for mask in masks:
+            neighbours = codes ^ mask
+            neighbours = neighbours[sketch.add(neighbours) > threshold]
+            pending.append(neighbours)
+            pending_size += len(neighbours)
+            if pending_size > heavy_hitters:
+                table, threshold = _top_estimates(sketch, table, pending, heavy_hitters)
+                pending = []
+                pending_size = 0
+    table = np.sort(_top_estimates(sketch, table, pending, heavy_hitters)[0])
+
+    # Neighbours of k-mers are expanded again as in the first pass, and only those in the table are counted, so the
+    # memory is one chunk of neighbours rather than the neighbourhoods of all candidates. Most neighbours are not in the
+    # table and are dropped by the bitmap of low bits of its codes before the binary search
+    counts = np.zeros(len(table), dtype=np.int64)
+    if len(table) > 0:
+        filter_mask = np.uint64((1 << SKETCH_FILTER_BITS) - 1)
+        maybe_in_table = np.zeros(1 << SKETCH_FILTER_BITS, dtype=bool)
+        maybe_in_table[table & filter_mask] = True
+        for codes in _iter_kmer_code_chunks(data, k, chunk_size):
+            for mask in masks:
+                neighbours = codes ^ mask
+                neighbours = neighbours[maybe_in_table[neighbours & filter_mask]]
+                found_at = np.minimum(np.searchsorted(table, neighbours), len(table) - 1)
+                found = table[found_at] == neighbours
+                counts += np.bincount(found_at[found], minlength=len(table))
+
+    count = int(counts.max()) if len(counts) > 0 else 0
+    words = [decode_kmer(int(code), k) for code in table[counts == count]] if count > 0 else []
+    return SketchedFrequents(words, count, len(table), sketch.error, sketch.confidence)
+
+
+# Number of the most frequent k-mers whose frequencies with mismatches seed the trie search
+TRIE_SEEDS = 16
+
+# Largest length of pattern suffixes which the trie search may count in a flat array of 4**length cells
+TRIE_BLOCK_LENGTH = 10
+
+# Maximum number of neighbours counted at once by the trie search; a trie node whose k-mers have at most this many
+# neighbours in its subtree counts them at once instead of walking the subtree
+TRIE_CHUNK_SIZE = 1 << 22
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_LOW_BITS = np.uint64(0x5555555555555555)
+
+
+def _neighbourhood_frequency(codes: np.ndarray, counts: np.ndarray, pattern: int, mismatches: int) -> int:
+    """
+    Count occurrences of a pattern code with at most 'mismatches' mismatches, given distinct k-mer codes and their
+    counts. A base mismatches if any bit of its 2-bit field differs
+    """
+    differences = codes ^ np.uint64(pattern)
+    differences = (differences | (differences >> np.uint64(1))) & _LOW_BITS
+    distances = _POPCOUNT[differences.view(np.uint8)].reshape(len(codes), 8).sum(axis=1)
+    return int(counts[distances <= mismatches].sum())
+
+
+def _trie_children(codes: np.ndarray, counts: np.ndarray, used: np.ndarray, shift: int, mismatches: int) -> list:
+    """
+    Extend a trie node by each of the four bases.
+
+    A k-mer with no mismatches left only occurs in patterns which end with its suffix, so k-mers without mismatches left
+    add to the bound of a child at most the largest total count of such k-mers with the same suffix
+    :param codes: codes of k-mers within the mismatch budget of the node prefix
+    :param counts: their counts
+    :param used: their mismatches with the node prefix
+    :param shift: bit offset of the base to extend by in k-mer codes
+    :param mismatches: mismatch budget
+    :return: a list of (codes, counts, mismatches used, upper bound of frequency) of the four children of the node
+    """
+    bases = (codes >> np.uint64(shift)) & np.uint64(3)
+    spare = used < mismatches
     result = []
-    for pattern, frequency in frequencies.items():
-        if frequency == max_frequency:
-            result.append(pattern)
+    for base in range(4):
+        matches = bases == base
+        keep = matches | spare
+        child_codes = codes[keep]
+        child_counts = counts[keep]
+        child_used = used[keep] + ~matches[keep]
 
+        exhausted = child_used >= mismatches
+        bound = int(child_counts[~exhausted].sum())
+        if exhausted.any():
+            suffixes = child_codes[exhausted] & np.uint64((1 << shift) - 1)
+            _, suffix_groups = np.unique(suffixes, return_inverse=True)
+            bound += int(np.bincount(suffix_groups.ravel(), weights=child_counts[exhausted]).max())
+        result.append((child_codes, child_counts, child_used, bound))
     return result
 
 
+def _suffix_neighbours(suffixes: np.ndarray, counts: np.ndarray, spare: np.ndarray, length: int, mismatches: int,
+                       chunk_size: int):
+    """
+    Iterate over neighbours of k-mer suffixes within their remaining mismatch budgets, obtained as 'suffix ^ mask' for
+    precomputed XOR masks
+    :param spare: remaining mismatches of every suffix
+    :return: a generator of chunks of (neighbour codes, counts of the k-mers they come from)
+    """
+    for budget in range(mismatches + 1):
+        selected = spare == budget
+        if not selected.any():
+            continue
+        selected_suffixes = suffixes[selected]
+        selected_counts = counts[selected]
+        masks = np.array(mismatch_masks(length, budget), dtype=np.uint64)
+        rows = max(chunk_size // len(masks), 1)
+        for start in range(0, len(selected_suffixes), rows):
+            neighbours = selected_suffixes[start:start + rows, np.newaxis] ^ masks
+            neighbour_counts = np.broadcast_to(selected_counts[start:start + rows, np.newaxis], neighbours.shape)
+            yield neighbours.ravel(), neighbour_counts.ravel()
+
+
+def _suffix_frequencies(codes: np.ndarray, counts: np.ndarray, used: np.ndarray, length: int, mismatches: int,
+                        neighbours: int) -> tuple:
+    """
+    Count frequencies of all completions of a trie node which occur in the genome with mismatches: every k-mer adds its
+    count to the neighbours of its suffix within its remaining mismatch budget. Dense completions are counted in a flat
+    array of 4**length cells (see DENSE_SPARSITY_MAX), sparse ones by sorting the neighbours
+    :param codes: codes of k-mers within the mismatch budget of the node prefix
+    :param counts: their counts
+    :param used: their mismatches with the node prefix
+    :param length: suffix length
+    :param mismatches: mismatch budget
+    :param neighbours: the number of neighbours; sparse completions are counted in one chunk, so at most TRIE_CHUNK_SIZE
+    :return: suffix codes of the completions, and their frequencies
+    """
+    suffixes = codes & np.uint64((1 << (2 * length)) - 1)
+    spare = mismatches - used.astype(np.int64)
+    if length <= TRIE_BLOCK_LENGTH and neighbours * DENSE_SPARSITY_MAX >= 1 << (2 * length):
+        frequencies = np.zeros(1 << (2 * length), dtype=np.int64)
+        for chunk, chunk_counts in _suffix_neighbours(suffixes, counts, spare, length, mismatches, TRIE_CHUNK_SIZE):
+            frequencies += np.bincount(
+                chunk.astype(np.intp), weights=chunk_counts, minlength=len(frequencies)
+            ).astype(np.int64)
+        return np.arange(len(frequencies), dtype=np.uint64), frequencies
+
+    chunks = list(_suffix_neighbours(suffixes, counts, spare, length, mismatches, neighbours))
+    completions, completion_of = np.unique(np.concatenate([chunk for chunk, _ in chunks]), return_inverse=True)
+    frequencies = np.bincount(
+        completion_of.ravel(), weights=np.concatenate([chunk_counts for _, chunk_counts in chunks])
+    ).astype(np.int64)
+    return completions, frequencies
+
+
+def _completion_neighbours(used: np.ndarray, length: int, mismatches: int) -> int:
+    """
+    Get the number of neighbours of suffixes of the given length of k-mers within their remaining mismatch budgets
+    :param used: mismatches of the k-mers with the node prefix
+    """
+    used_counts = np.bincount(used, minlength=mismatches + 1)
+    return sum(int(used_counts[u]) * neighbourhood_size(length, mismatches - u) for u in range(mismatches + 1))
+
+
+def frequent_words_with_mismatches_trie(genome: str, k: int, mismatches: int, stats: dict = None) -> list:
+    """
+    Find most frequent patterns of length 'k' in 'genome' with at most 'mismatches' mismatches, walking a k-mer trie.
+
+    Every node of the trie is a pattern prefix, which keeps arrays of the distinct k-mers of the genome whose prefixes
+    are within the mismatch budget of it. Only nodes reachable from k-mers which occur in the genome are visited. The
+    total count of these k-mers bounds the frequency of every pattern under the node, so a node is pruned when its
+    bound is lower than the best frequency found so far. The best frequency starts from the frequencies of the
+    TRIE_SEEDS most frequent k-mers, and children with larger bounds are visited first.
+
+    A node is not walked further once its k-mers have at most TRIE_CHUNK_SIZE neighbours in its subtree, or its
+    remaining suffix is at most TRIE_BLOCK_LENGTH long: all its completions are counted at once (see
+    '_suffix_frequencies()'). Most of the work is thus done in array operations rather than per node or per neighbour,
+    which makes this several times faster than 'frequent_words_with_mismatches()'
+    :param genome: genome to examine
+    :param k: pattern length; above KMER_K_MAX, whose codes do not fit into uint64, 'frequent_words_with_mismatches()'
+    is used
+    :param mismatches: maximum number of mismatches
+    :param stats: if given, filled with the number of 'scored' candidate patterns and 'pruned' candidate prefixes (both
+    0 if the trie is not used)
+    :return: a list of patterns, sorted
+    """
+    if stats is not None:
+        stats['scored'] = 0
+        stats['pruned'] = 0
+    if k > KMER_K_MAX:
+        return frequent_words_with_mismatches(genome, k, mismatches)
+    try:
+        codes = encode_genome(genome)
+    except ValueError:
+        return sorted(_frequent_words_with_mismatches_strings(genome, k, mismatches))
+
+    kmer_counts = count_kmer_codes(codes, k)
+    kmer_codes = np.array(list(kmer_counts.keys()), dtype=np.uint64)
+    counts = np.array(list(kmer_counts.values()), dtype=np.int64)
+
+    max_frequency = 0
+    if len(kmer_codes) > 0:
+        seeds = kmer_codes[np.argsort(-counts, kind='stable')[:TRIE_SEEDS]]
+        max_frequency = max(_neighbourhood_frequency(kmer_codes, counts, int(seed), mismatches) for seed in seeds)
+    result = []
+    scored = 0
+    pruned = 0
+
+    # Stack of trie nodes: (prefix code, depth, codes, counts, mismatches used, bound)
+    stack = [(0, 0, kmer_codes, counts, np.zeros(len(kmer_codes), dtype=np.uint8), int(counts.sum()))]
+    while len(stack) > 0:
+        prefix, depth, node_codes, node_counts, used, bound = stack.pop()
+        if bound < max_frequency or bound == 0:
+            pruned += 1
+            continue
+
+        length = k - depth
+        neighbours = _completion_neighbours(used, length, mismatches)
+        if length <= TRIE_BLOCK_LENGTH or neighbours <= TRIE_CHUNK_SIZE:
+            completions, frequencies = _suffix_frequencies(
+                node_codes, node_counts, used, length, mismatches, neighbours
+            )
+            scored += len(frequencies)
+            frequency = int(frequencies.max())
+            if frequency < max_frequency:
+                continue
+            if frequency > max_frequency:
+                max_frequency = frequency
+                result = []
+            prefix <<= 2 * length
+            result.extend(prefix | int(code) for code in completions[frequencies == frequency])
+            continue
+
+        children = _trie_children(node_codes, node_counts, used, 2 * (k - 1 - depth), mismatches)
+        for base in sorted(range(4), key=lambda base: children[base][3]):
+            child_codes, child_counts, child_used, child_bound = children[base]
+            if child_bound == 0:
+                continue
+            if child_bound < max_frequency:
+                pruned += 1
+                continue
+            stack.append(((prefix << 2) | base, depth + 1, child_codes, child_counts, child_used, child_bound))
+
+    if stats is not None:
+        stats['scored'] = scored
+        stats['pruned'] = pruned
+
+    return [decode_kmer(code, k) for code in sorted(result)]
+
+
 if __name__ == '__main__':
     main()
@@ -1,40 +1,28 @@
 #!/usr/bin/env python3
 
+import argparse
+from array import array
+from collections import Counter
 
-def main():
-    genome = input().upper()
-    k, mismatches = list(map(int, input().split()))
-
-    frequents = frequent_words_with_mismatches_and_rc(genome, k, mismatches)
-    for word in frequents:
-        print(word, end=' ')
-    print()
+from kmer_encoding import DENSE_K_MAX, encode_genome, count_kmer_codes, reverse_complement_code, mismatch_masks, \
+    kmer_counter, max_count, codes_with_count, decode_kmer
+from neighbourhood import generate_neighbours
+from result_writer import write_items
 
 
-LIST_A = ['C', 'T', 'G']
-LIST_C = ['A', 'T', 'G']
-LIST_T = ['C', 'A', 'G']
-LIST_G = ['C', 'T', 'A']
-
+def main():
+    parser = argparse.ArgumentParser(description='Find most frequent k-mers with mismatches and reverse complements')
+    parser.add_argument(
+        '--no-canonical', dest='canonical', action='store_false',
+        help='count both strands of every neighbour as strings instead of counting canonical k-mer codes'
+    )
+    args = parser.parse_args()
 
-def _generate_immediate_neighbours(pattern: str) -> list:
-    """
-    Generate immediate (different by one mismatch) neighbours of the given genome pattern
-    :param pattern: a pattern to examine
-    :return: neighbourhood, NOT including the given pattern
-    """
-    generated = []
-    for i in range(len(pattern)):
-        if pattern[i] == 'A':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_A])
-        elif pattern[i] == 'C':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_C])
-        elif pattern[i] == 'T':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_T])
-        elif pattern[i] == 'G':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_G])
+    genome = input().upper()
+    k, mismatches = list(map(int, input().split()))
 
-    return generated
+    frequents = frequent_words_with_mismatches_and_rc(genome, k, mismatches, canonical=args.canonical)
+    write_items(frequents)
 
 
 RC_PIPELINE_A = ['A', 'a', 'T']
@@ -56,46 +44,97 @@ def _reverse_complement(genome: str) -> str:
         [::-1]
 
 
-def generate_neighbours(pattern: str, mismatches: int) -> set:
+def _palindrome_codes(k: int) -> list:
     """
-    Generate neighbours for the given pattern (genome string)
-    :param pattern: genome pattern
-    :param mismatches: number of mismatches to generate neighbours
-    :return: a set of patterns in the neighbourhood, including the 'pattern' itself
+    Get codes of all k-mers which are their own reverse complements
     """
-    neighbourhood = set()
-    neighbourhood.add(pattern)
+    if k % 2 == 1:
+        return []
+    return [(half << k) | reverse_complement_code(half, k // 2) for half in range(1 << k)]
 
-    curr_patterns = [pattern]
-    next_patterns = []
 
-    for curr_mismatches in range(mismatches):
-        for curr_pattern in curr_patterns:
-            for neighbour in _generate_immediate_neighbours(curr_pattern):
-                if neighbour not in neighbourhood:
-                    neighbourhood.add(neighbour)
-                    next_patterns.append(neighbour)
-
-        curr_patterns = next_patterns
-        next_patterns = []
+def _counted_palindromes(frequencies, k: int) -> list:
+    """
+    Get codes of k-mers which are their own reverse complements and have a non-zero count in a counter created by
+    'kmer_counter()'. A flat array has at most 4**dense_k_max cells, so its 2**k palindromes are looked up; keys of a
+    sparse dict are checked one by one
+    """
+    if k % 2 == 1:
+        return []
+    if isinstance(frequencies, array):
+        return [code for code in _palindrome_codes(k) if frequencies[code] > 0]
+    return [code for code in frequencies if code == reverse_complement_code(code, k)]
 
-    return neighbourhood
 
+def _frequent_canonical_words_with_mismatches(codes: bytes, k: int, mismatches: int, dense_k_max: int) -> list:
+    """
+    Implementation of 'frequent_words_with_mismatches_and_rc()' which counts canonical k-mers only.
 
-def frequent_words_with_mismatches_and_rc(genome: str, k: int, mismatches: int) -> list:
+    A canonical k-mer is the minimum of a k-mer code and the code of its reverse complement. The neighbourhood of the
+    reverse complement of a window is the reverse complement of the window's neighbourhood, so windows are merged into
+    canonical k-mers before neighbourhoods are expanded. The count of a canonical k-mer is the count of both its
+    strands, except a palindrome, which is counted twice by every neighbour equal to it
+    """
+    window_counts = Counter()
+    for code, count in count_kmer_codes(codes, k).items():
+        window_counts[min(code, reverse_complement_code(code, k))] += count
+
+    # The reverse complement of 'code ^ mask' is 'rc(code) ^ reverse(mask)'; reverse without complement is 'rc ^ 11..11'
+    all_complemented = (1 << (2 * k)) - 1
+    masks = [
+        (mask, reverse_complement_code(mask, k) ^ all_complemented) for mask in mismatch_masks(k, mismatches)
+    ]
+    frequencies = kmer_counter(k, dense_k_max, len(window_counts) * len(masks))
+
+    for code, count in window_counts.items():
+        code_rc = reverse_complement_code(code, k)
+        for mask, mask_reversed in masks:
+            neighbour = code ^ mask
+            neighbour_rc = code_rc ^ mask_reversed
+            frequencies[neighbour if neighbour < neighbour_rc else neighbour_rc] += count
+
+    palindromes = _counted_palindromes(frequencies, k)
+    max_frequency = max(max_count(frequencies), max((2 * frequencies[code] for code in palindromes), default=0))
+    if max_frequency == 0:
+        return []
+
+    result = set()
+    for code in codes_with_count(frequencies, max_frequency):
+        result.add(code)
+        result.add(reverse_complement_code(code, k))
+    if max_frequency % 2 == 0:
+        result.update(code for code in palindromes if frequencies[code] == max_frequency // 2)
+
+    return [decode_kmer(code, k) for code in sorted(result)]
+
+
+def frequent_words_with_mismatches_and_rc(
+        genome: str, k: int, mismatches: int, canonical: bool = True, dense_k_max: int = DENSE_K_MAX
+) -> list:
     """
     Find most frequent patterns of length 'k' in 'genome' with at most 'mismatches' mismatches, counting reverse complements as original string or its mismatches
     :param genome: genome to examine
     :param k: pattern length
     :param mismatches: maximum number of mismatches
+    :param canonical: count canonical k-mer codes (only one strand of each pattern is stored) instead of strings.
+    Ignored if 'genome' contains characters other than 'A', 'C', 'G', 'T'
+    :param dense_k_max: largest 'k' to count canonical k-mers in a flat array of 4**k cells instead of a sparse dict (if
+    the genome is large enough, see 'kmer_counter()')
     :return: a list of patterns
     """
+    if canonical:
+        try:
+            codes = encode_genome(genome)
+        except ValueError:
+            codes = None
+        if codes is not None:
+            return _frequent_canonical_words_with_mismatches(codes, k, mismatches, dense_k_max)
+
     frequencies = {}
 
     for sstart in range(len(genome) - k + 1):
         sequence = genome[sstart:sstart + k]
-        neighbours = list(generate_neighbours(sequence, mismatches))
-        for neighbour in neighbours:
+        for neighbour in generate_neighbours(sequence, mismatches):
             neighbour_rc = _reverse_complement(neighbour)
             frequencies[neighbour] = frequencies.get(neighbour, 0) + 1
             frequencies[neighbour_rc] = frequencies.get(neighbour_rc, 0) + 1
@@ -1,83 +1,276 @@
 #!/usr/bin/env python3
 
+import argparse
+import re
+import sys
+from math import comb
+
+from genome_index import GenomeIndex
+from kmer_index import KMER_K_MAX, load_or_build_index
+from neighbourhood import SUBSTITUTIONS, iter_neighbours
+from result_writer import write_items
+
 
 def main():
-    pattern = input().upper()
-    genome = input().upper()
-    mismatches = int(input())
+    parser = argparse.ArgumentParser(description='Find approximate occurrences of a pattern in a genome')
+    parser.add_argument(
+        '--index',
+        help='search in the genome index with this prefix (built by genome_index.py); '
+             'standard input then only contains the pattern and the number of mismatches'
+    )
+    parser.add_argument(
+        '--strategy', choices=['auto'] + list(STRATEGIES.keys()), default='auto',
+        help="'neighbourhood' searches every neighbour of the pattern; 'pigeonhole' verifies exact hits of d + 1 "
+             "seeds of the pattern; 'bitparallel' counts mismatches of all windows at once in bit vectors; "
+             "'auto' chooses by the pattern length and the number of mismatches"
+    )
+    parser.add_argument(
+        '--kmer-index',
+        help='look neighbours up in the k-mer index file at this path (k is the pattern length), built (or rebuilt if '
+             'the genome or the pattern length changed) on demand'
+    )
+    args = parser.parse_args()
+
+    if args.index is not None:
+        pattern = input().upper()
+        mismatches = int(input())
+        occurrences = GenomeIndex.load(args.index).approximate_occurrences(pattern, mismatches)
+    else:
+        pattern = input().upper()
+        genome = input().upper()
+        mismatches = int(input())
+        if args.kmer_index is not None and len(pattern) > KMER_K_MAX:
+            print(
+                'The k-mer index supports patterns up to {} bases, scanning the genome instead'.format(KMER_K_MAX),
+                file=sys.stderr
+            )
+            args.kmer_index = None
+        if args.kmer_index is not None:
+            occurrences = load_or_build_index(args.kmer_index, genome, len(pattern)).occurrences(pattern, mismatches)
+        else:
+            occurrences = iter_occurrences(genome, pattern, mismatches, args.strategy)
+
+    write_items(occurrences, flush=True)
+
+
+def approximate_occurrences(genome: str, pattern: str, mismatches: int) -> list:
+    occurrences = set()
+
+    for neighbour in iter_neighbours(pattern, mismatches):
+        search_start = 0
+        while search_start <= len(genome) - len(pattern):
+            index_found = genome.find(neighbour, search_start)
+            if index_found == -1:
+                break
+            occurrences.add(index_found)
+            search_start = index_found + 1
+
+    return sorted(list(occurrences))
 
-    occurrences = approximate_occurrences(genome, pattern, mismatches)
-    for o in occurrences:
-        print(o, end=' ')
-    print()
 
+# Largest neighbourhood size for which the 'neighbourhood' strategy is chosen automatically
+NEIGHBOURHOOD_SIZE_MAX = 20
 
-LIST_A = ['C', 'T', 'G']
-LIST_C = ['A', 'T', 'G']
-LIST_T = ['C', 'A', 'G']
-LIST_G = ['C', 'T', 'A']
 
+def neighbourhood_size(k: int, mismatches: int) -> int:
+    """
+    Get the number of patterns with at most 'mismatches' mismatches from a pattern of length 'k'
+    """
+    return sum(comb(k, i) * 3 ** i for i in range(min(mismatches, k) + 1))
 
-def _generate_immediate_neighbours(pattern: str) -> list:
+
+def choose_strategy(k: int, mismatches: int) -> str:
     """
-    Generate immediate (different by one mismatch) neighbours of the given genome pattern
-    :param pattern: a pattern to examine
-    :return: neighbourhood, NOT including the given pattern
+    Choose the strategy to find approximate occurrences of a pattern of length 'k'. The neighbourhood strategy scans the
+    genome once per neighbour, so it is chosen for small neighbourhoods only. Otherwise, the bit-parallel scan is
+    chosen: its cost does not depend on the neighbourhood size. The pigeonhole strategy is never chosen: building its
+    seed index alone takes longer than the bit-parallel scan, for any 'k' and 'mismatches'
+    :return: 'neighbourhood' or 'bitparallel'
     """
-    generated = []
-    for i in range(len(pattern)):
-        if pattern[i] == 'A':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_A])
-        elif pattern[i] == 'C':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_C])
-        elif pattern[i] == 'T':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_T])
-        elif pattern[i] == 'G':
-            generated.extend([pattern[:i] + c + pattern[i + 1:] for c in LIST_G])
+    if neighbourhood_size(k, mismatches) <= NEIGHBOURHOOD_SIZE_MAX:
+        return 'neighbourhood'
+    return 'bitparallel'
 
-    return generated
 
+def _seeds(k: int, mismatches: int) -> list:
+    """
+    Split a pattern of length 'k' into 'mismatches' + 1 seeds of nearly equal lengths ('mismatches' must be less than
+    'k')
+    :return: a list of seed start positions; the shortest seeds go last
+    """
+    total_seeds = mismatches + 1
+    longer_seeds = k % total_seeds
+    seed_length = k // total_seeds
+    return [i * seed_length + min(i, longer_seeds) for i in range(total_seeds)]
 
-def generate_neighbours(pattern: str, mismatches: int) -> set:
+
+def build_seed_index(genome: str, seed_length: int) -> dict:
     """
-    Generate neighbours for the given pattern (genome string)
-    :param pattern: genome pattern
-    :param mismatches: number of mismatches to generate neighbours
-    :return: a set of patterns in the neighbourhood, including the 'pattern' itself
+    Build a hash index of all substrings of the given length of 'genome'
+    :return: a map: substring -> a list of its positions
     """
-    neighbourhood = set()
-    neighbourhood.add(pattern)
+    index = {}
+    for sstart in range(len(genome) - seed_length + 1):
+        seed = genome[sstart:sstart + seed_length]
+        positions = index.get(seed)
+        if positions is None:
+            index[seed] = [sstart]
+        else:
+            positions.append(sstart)
+    return index
 
-    curr_patterns = [pattern]
-    next_patterns = []
 
-    for curr_mismatches in range(mismatches):
-        for curr_pattern in curr_patterns:
-            for neighbour in _generate_immediate_neighbours(curr_pattern):
-                if neighbour not in neighbourhood:
-                    neighbourhood.add(neighbour)
-                    next_patterns.append(neighbour)
+def _within_mismatches(genome: str, start: int, pattern: str, mismatches: int) -> bool:
+    """
+    Check the substring of 'genome' at 'start' differs from 'pattern' by at most 'mismatches' mismatches. As in
+    neighbourhoods, only 'A', 'C', 'G', 'T' may be substituted
+    """
+    for i in range(len(pattern)):
+        if genome[start + i] != pattern[i]:
+            if genome[start + i] not in SUBSTITUTIONS or pattern[i] not in SUBSTITUTIONS:
+                return False
+            mismatches -= 1
+            if mismatches < 0:
+                return False
+    return True
+
+
+def pigeonhole_occurrences(genome: str, pattern: str, mismatches: int) -> list:
+    """
+    Find all positions in 'genome' where 'pattern' occurs with at most 'mismatches' mismatches, using seeds.
 
-        curr_patterns = next_patterns
-        next_patterns = []
+    The pattern is split into 'mismatches' + 1 seeds; by the pigeonhole principle, at least one of them occurs exactly
+    in every approximate occurrence. Exact hits of seeds (of the length of the shortest seed) are found in a hash index
+    of the genome, and every candidate position is verified by a Hamming check
+    :return: a sorted list of positions
+    """
+    if len(pattern) == 0:
+        return approximate_occurrences(genome, pattern, mismatches)
 
-    return neighbourhood
+    if mismatches >= len(pattern):
+        candidates = range(len(genome) - len(pattern) + 1)
+    else:
+        seed_starts = _seeds(len(pattern), mismatches)
+        seed_length = len(pattern) // len(seed_starts)
+        seed_index = build_seed_index(genome, seed_length)
 
+        candidates = set()
+        for seed_start in seed_starts:
+            for position in seed_index.get(pattern[seed_start:seed_start + seed_length], ()):
+                candidate = position - seed_start
+                if 0 <= candidate <= len(genome) - len(pattern):
+                    candidates.add(candidate)
 
-def approximate_occurrences(genome: str, pattern: str, mismatches: int) -> list:
-    neighbours = generate_neighbours(pattern, mismatches)
     occurrences = set()
+    for candidate in candidates:
+        if _within_mismatches(genome, candidate, pattern, mismatches):
+            occurrences.add(candidate)
 
-    for neighbour in neighbours:
-        search_start = 0
-        while search_start <= len(genome) - len(pattern):
-            index_found = genome.find(neighbour, search_start)
-            if index_found == -1:
+    return sorted(list(occurrences))
+
+
+def _bitmask(genome: str, alphabet: set, chars: set) -> int:
+    """
+    Convert the genome into a bit vector: bit 'i' is set if 'genome[i]' is one of 'chars'
+    :param alphabet: all characters of 'genome'
+    """
+    table = {ord(c): '1' if c in chars else '0' for c in alphabet}
+    return int(genome.translate(table)[::-1] or '0', 2)
+
+
+def _set_bits(vector: int, length: int):
+    """
+    Iterate over indexes of set bits of a bit vector of the given length, in increasing order
+    """
+    data = vector.to_bytes((length + 7) // 8, 'little')
+    for match in re.finditer(b'[^\x00]', data):
+        byte_index = match.start()
+        byte = data[byte_index]
+        for bit in range(8):
+            if (byte >> bit) & 1:
+                yield byte_index * 8 + bit
+
+
+def bitparallel_occurrences(genome: str, pattern: str, mismatches: int) -> list:
+    """
+    Find all positions in 'genome' where 'pattern' occurs with at most 'mismatches' mismatches, counting mismatches of
+    all windows at once.
+
+    This is the shift-add (Baeza-Yates-Gonnet) mismatch counting, transposed: instead of a state of per-pattern-position
+    counters shifted along the genome, per-window counters are kept as bit-sliced big-int vectors over all genome
+    positions. For every pattern position, the vector of the genome base equal to the pattern base is shifted to
+    align with window starts, and windows where it is not set get one mismatch added (a ripple-carry addition of bit
+    vectors). Counters saturate into an overflow vector. The genome is processed in one linear pass per pattern
+    position, without neighbourhoods or substrings
+    :return: a sorted list of positions
+    """
+    windows = len(genome) - len(pattern) + 1
+    if len(pattern) == 0 or windows <= 0:
+        return approximate_occurrences(genome, pattern, mismatches)
+
+    alphabet = set(genome)
+    bitmasks = {c: _bitmask(genome, alphabet, {c}) for c in set(pattern)}
+    other_bitmask = _bitmask(genome, alphabet, alphabet - set(SUBSTITUTIONS.keys()))
+    all_windows = (1 << windows) - 1
+
+    # Bit 'b' of the mismatches count of the window at 'i' is bit 'i' of 'planes[b]'
+    planes = [0] * mismatches.bit_length()
+    overflow = 0
+
+    for j, c in enumerate(pattern):
+        if c not in SUBSTITUTIONS:
+            # Characters other than 'A', 'C', 'G', 'T' are never substituted
+            overflow |= ~(bitmasks[c] >> j) & all_windows
+            continue
+        overflow |= (other_bitmask >> j) & all_windows
+
+        carry = ~(bitmasks[c] >> j) & all_windows
+        for b in range(len(planes)):
+            if carry == 0:
                 break
-            occurrences.add(index_found)
-            search_start = index_found + 1
+            planes[b], carry = planes[b] ^ carry, planes[b] & carry
+        overflow |= carry
 
-    return sorted(list(occurrences))
+    # Windows whose count is greater than 'mismatches', comparing bit planes from the highest one
+    greater = 0
+    equal = all_windows
+    for b in reversed(range(len(planes))):
+        if (mismatches >> b) & 1:
+            equal &= planes[b]
+        else:
+            greater |= equal & planes[b]
+            equal &= ~planes[b]
+
+    return list(_set_bits(all_windows & ~overflow & ~greater, windows))
+
+
+STRATEGIES = {
+    'neighbourhood': approximate_occurrences,
+    'pigeonhole': pigeonhole_occurrences,
+    'bitparallel': bitparallel_occurrences,
+}
+
+# Number of window starts searched at once by 'iter_occurrences()'
+OCCURRENCES_BLOCK_SIZE = 1 << 16
+
+
+def iter_occurrences(genome: str, pattern: str, mismatches: int, strategy: str = 'auto',
+                     block_size: int = OCCURRENCES_BLOCK_SIZE):
+    """
+    Find all positions in 'genome' where 'pattern' occurs with at most 'mismatches' mismatches, producing them while the
+    search goes on. The genome is searched in blocks of 'block_size' window starts (overlapping by the pattern length
+    minus one), so positions of only one block are kept at a time
+    :param strategy: a key of STRATEGIES, or 'auto' to choose by the pattern length and the number of mismatches
+    :return: a generator of positions, in increasing order
+    """
+    if strategy == 'auto':
+        strategy = choose_strategy(len(pattern), mismatches)
+    search = STRATEGIES[strategy]
+
+    for block_start in range(0, len(genome) - len(pattern) + 1, block_size):
+        block = genome[block_start:block_start + block_size + len(pattern) - 1]
+        for position in search(block, pattern, mismatches):
+            yield block_start + position
 
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+from kmer_encoding import INVALID_CODE, encode_bytes, encode_genome
+from neighbourhood import iter_neighbours
+from result_writer import write_items
+from sequence_io import iter_sequence_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find approximate occurrences of many patterns in one genome')
+    parser.add_argument('queries', help='a file with one query per line: a pattern and the number of mismatches')
+    parser.add_argument(
+        '--genome-file', help='read the genome (FASTA or raw sequence) from this file instead of standard input'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=BATCH_SIZE,
+        help='number of queries searched in one pass over the genome; results are printed after every pass'
+    )
+    args = parser.parse_args()
+
+    if args.genome_file is not None:
+        genome = b''.join(iter_sequence_chunks(args.genome_file)).decode('ascii')
+    else:
+        genome = input().upper()
+
+    queries = []
+    with open(args.queries) as f:
+        for line_number, line in enumerate(f, 1):
+            if len(line.strip()) == 0:
+                continue
+            try:
+                query = parse_query(line)
+            except ValueError as error:
+                print('Skipping the query on line {}: {}'.format(line_number, error), file=sys.stderr)
+                continue
+            queries.append(query)
+
+    for i, occurrences in iter_batch_occurrences(genome, queries, args.batch_size):
+        write_items(occurrences, '{} {}: '.format(*queries[i]), flush=True)
+
+
+# Default number of queries whose neighbourhoods are searched in one pass over the genome
+BATCH_SIZE = 64
+
+
+def parse_query(line: str) -> tuple:
+    """
+    Parse a query line: a pattern of 'A', 'C', 'G', 'T' (in any case) and a non-negative number of mismatches
+    :return: (pattern, mismatches)
+    :raises ValueError: if the line is not a valid query
+    """
+    fields = line.split()
+    if len(fields) != 2:
+        raise ValueError('expected a pattern and the number of mismatches, got {} fields'.format(len(fields)))
+    pattern = fields[0].upper()
+    # Patterns become paths of the automaton over 'A', 'C', 'G', 'T', so other characters are rejected here
+    encode_genome(pattern)
+    mismatches = int(fields[1])
+    if mismatches < 0:
+        raise ValueError('the number of mismatches must not be negative, got {}'.format(mismatches))
+    return pattern, mismatches
+
+
+def _build_automaton(words: dict) -> tuple:
+    """
+    Build an Aho-Corasick automaton over the alphabet 'A', 'C', 'G', 'T'
+    :param words: a map: word -> a list of query indexes it is an output for
+    :return: transitions (a list of 4 target states per state), outputs (a list of query indexes per state), depths of
+    states, and output links (the nearest state along the failure chain which has outputs, or 0)
+    """
+    transitions = [[-1] * 4]
+    outputs = [[]]
+    depths = [0]
+
+    for word, query_indexes in words.items():
+        state = 0
+        for c in encode_genome(word):
+            if transitions[state][c] == -1:
+                transitions[state][c] = len(transitions)
+                transitions.append([-1] * 4)
+                outputs.append([])
+                depths.append(depths[state] + 1)
+            state = transitions[state][c]
+        outputs[state].extend(query_indexes)
+
+    # Breadth-first: failure links of a state's children are resolved after the state itself. Missing transitions are
+    # replaced by the transitions of the failure state, turning the trie into a DFA
+    failures = [0] * len(transitions)
+    output_links = [0] * len(transitions)
+    queue = []
+    for c in range(4):
+        if transitions[0][c] == -1:
+            transitions[0][c] = 0
+        else:
+            queue.append(transitions[0][c])
+
+    for state in queue:
+        for c in range(4):
+            child = transitions[state][c]
+            if child == -1:
+                transitions[state][c] = transitions[failures[state]][c]
+                continue
+            failure = transitions[failures[state]][c]
+            failures[child] = failure
+            output_links[child] = failure if len(outputs[failure]) > 0 else output_links[failure]
+            queue.append(child)
+
+    return transitions, outputs, depths, output_links
+
+
+def _batch_occurrences(codes: bytes, queries: list) -> list:
+    """
+    Find approximate occurrences of all the given queries in one pass over an encoded genome
+    :param codes: the genome encoded by 'encode_bytes()'
+    :param queries: a list of (pattern, mismatches)
+    :return: a list of sorted lists of positions, one per query
+    """
+    words = {}
+    for query_index, (pattern, mismatches) in enumerate(queries):
+        for neighbour in iter_neighbours(pattern, mismatches):
+            words.setdefault(neighbour, []).append(query_index)
+
+    transitions, outputs, depths, output_links = _build_automaton(words)
+    reports = [len(outputs[state]) > 0 or output_links[state] != 0 for state in range(len(transitions))]
+
+    result = [[] for _ in queries]
+    state = 0
+    for i, c in enumerate(codes):
+        if c == INVALID_CODE:
+            state = 0
+            continue
+        state = transitions[state][c]
+        if not reports[state]:
+            continue
+
+        output_state = state if len(outputs[state]) > 0 else output_links[state]
+        while output_state != 0:
+            position = i - depths[output_state] + 1
+            for query_index in outputs[output_state]:
+                result[query_index].append(position)
+            output_state = output_links[output_state]
+
+    return result
+
+
+def iter_batch_occurrences(genome: str, queries: list, batch_size: int = BATCH_SIZE):
+    """
+    Find approximate occurrences of many patterns in one genome.
+
+    The genome is encoded once. Queries are processed in batches: neighbourhoods of all queries of a batch are merged
+    into one Aho-Corasick automaton (a neighbour shared by several queries is stored once), which is run over the
+    genome in one pass
+    :param genome: genome to examine
+    :param queries: a list of (pattern, mismatches); patterns must consist of 'A', 'C', 'G', 'T'
+    :param batch_size: number of queries in a batch
+    :return: a generator of (query index, sorted list of positions), producing results of a batch as soon as it is done
+    """
+    codes = encode_bytes(genome.encode('ascii'))
+    for batch_start in range(0, len(queries), batch_size):
+        batch = queries[batch_start:batch_start + batch_size]
+        for i, occurrences in enumerate(_batch_occurrences(codes, batch)):
+            yield batch_start + i, occurrences
+
+
+if __name__ == '__main__':
+    main()
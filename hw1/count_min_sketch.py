@@ -0,0 +1,85 @@
+"""
+A count-min sketch of k-mer codes: approximate counts in fixed memory.
+
+A sketch is a table of 'depth' rows of 'width' counters; every row has its own hash function. Adding a code increments
+one counter per row, and the estimate of a code is the minimum of its counters. An estimate is never lower than the
+true count, and exceeds it by more than (e / width) * total (the sum of all added counts) with probability at most
+e^-depth
+"""
+
+import math
+
+import numpy as np
+
+
+# Default numbers of counters in a row and of rows
+SKETCH_WIDTH = 1 << 20
+SKETCH_DEPTH = 4
+
+
+class CountMinSketch:
+    """
+    Approximate counts of k-mer codes (up to 64-bit integers)
+    """
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, seed: int = 0):
+        if width < 1 or depth < 1:
+            raise ValueError('Sketch width and depth must be positive')
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+        # Multiply-shift hashing: odd multipliers, arbitrary increments; the high 32 bits of the product are used
+        random = np.random.default_rng(seed)
+        self._multipliers = random.integers(0, 1 << 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._increments = random.integers(0, 1 << 63, size=depth, dtype=np.uint64)
+
+    @property
+    def error_rate(self) -> float:
+        """
+        Maximum overcount of an estimate, relative to the total count (holds with probability 'confidence')
+        """
+        return math.e / self.width
+
+    @property
+    def confidence(self) -> float:
+        return 1 - math.exp(-self.depth)
+
+    @property
+    def error(self) -> float:
+        """
+        Maximum overcount of an estimate for the counts added so far (holds with probability 'confidence')
+        """
+        return self.error_rate * self.total
+
+    def _columns(self, row: int, codes: np.ndarray) -> np.ndarray:
+        hashes = codes * self._multipliers[row] + self._increments[row]
+        return (hashes >> np.uint64(32)) % np.uint64(self.width)
+
+    def add(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Count one occurrence of every code in the array (repeated codes are counted repeatedly)
+        :return: estimates of the codes after adding them
+        """
+        codes = np.asarray(codes, dtype=np.uint64)
+        result = None
+        for row in range(self.depth):
+            columns = self._columns(row, codes)
+            np.add.at(self.table[row], columns, 1)
+            if result is None:
+                result = self.table[row][columns]
+            else:
+                np.minimum(result, self.table[row][columns], out=result)
+        self.total += len(codes)
+        return result
+
+    def estimate(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Estimate counts of the given codes
+        :return: an int64 array of estimates, one per code
+        """
+        codes = np.asarray(codes, dtype=np.uint64)
+        result = self.table[0][self._columns(0, codes)]
+        for row in range(1, self.depth):
+            np.minimum(result, self.table[row][self._columns(row, codes)], out=result)
+        return result
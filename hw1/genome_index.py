@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+"""
+A persistent suffix array index of a genome for approximate pattern search.
+
+An index consists of three NumPy files, which are memory-mapped on load:
+* '<prefix>.text.npy': the genome encoded into 2-bit codes (characters other than 'A', 'C', 'G', 'T' are encoded as 4);
+* '<prefix>.sa.npy': the suffix array of the genome;
+* '<prefix>.buckets.npy': ranges of the suffix array which start with each q-mer, for q chosen by the genome length
+"""
+
+import sys
+
+import numpy as np
+
+from kmer_encoding import encode_bytes, encode_genome, mismatch_masks
+from sequence_io import iter_sequence_chunks
+
+
+def main():
+    if len(sys.argv) != 3:
+        print('Usage: {} GENOME_FILE INDEX_PREFIX'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(2)
+
+    genome = b''.join(iter_sequence_chunks(sys.argv[1]))
+    index = GenomeIndex.build(genome)
+    index.save(sys.argv[2])
+    print('Indexed {} bases into {}.*.npy'.format(len(index.text), sys.argv[2]), file=sys.stderr)
+
+
+# Code of characters other than 'A', 'C', 'G', 'T' in the index text. It never matches any pattern, even with a mismatch
+OTHER_CODE = 4
+
+# Maximum length of prefixes the buckets table is built for
+BUCKETS_Q_MAX = 10
+
+# Suffix array ranges of at most this size are verified by direct comparison instead of further backtracking
+VERIFY_RANGE_MAX = 16
+
+_INDEX_FILES = ('text', 'sa', 'buckets')
+
+
+def _encode_text(genome) -> np.ndarray:
+    """
+    Encode a genome ('str' or bytes) into an array of codes 0..4
+    """
+    if isinstance(genome, str):
+        genome = genome.encode('ascii')
+    text = np.frombuffer(encode_bytes(genome), dtype=np.uint8).copy()
+    text[text > OTHER_CODE] = OTHER_CODE
+    return text
+
+
+def build_suffix_array(text: np.ndarray) -> np.ndarray:
+    """
+    Build the suffix array of 'text' by prefix doubling: suffixes are sorted by their first 2^i characters, using ranks
+    of the first 2^(i-1) characters computed on the previous step
+    :param text: an array of character codes
+    :return: an array of suffix start positions, sorted lexicographically by suffix (the end of text is lower than any
+    character). Positions are 32-bit if the text is short enough
+    """
+    n = len(text)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    rank = text.astype(np.int64)
+    multiplier = max(n, int(rank.max()) + 1) + 1
+    sa = np.argsort(rank, kind='stable')
+    offset = 1
+    while offset < n:
+        second = np.zeros(n, dtype=np.int64)
+        second[:n - offset] = rank[offset:] + 1
+        key = rank * multiplier + second
+
+        sa = np.argsort(key, kind='stable')
+        key_sorted = key[sa]
+        rank_sorted = np.zeros(n, dtype=np.int64)
+        np.cumsum(key_sorted[1:] != key_sorted[:-1], out=rank_sorted[1:])
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = rank_sorted
+
+        if rank_sorted[-1] == n - 1:
+            break
+        offset *= 2
+
+    if n < 2 ** 31:
+        return sa.astype(np.int32)
+    return sa
+
+
+def _build_buckets(text: np.ndarray, sa: np.ndarray, q: int) -> np.ndarray:
+    """
+    Find ranges of the suffix array which start with each q-mer
+    :return: an array of shape (2, 4**q): starts and ends of the ranges
+    """
+    n = len(text)
+    buckets = np.zeros((2, 1 << (2 * q)), dtype=np.int64)
+    if n < q:
+        return buckets
+
+    codes = np.zeros(n - q + 1, dtype=np.int64)
+    valid = np.ones(n - q + 1, dtype=bool)
+    for j in range(q):
+        window = text[j:n - q + 1 + j]
+        codes = (codes << 2) | (window & 3)
+        valid &= window < OTHER_CODE
+
+    sa_valid = np.flatnonzero((sa <= n - q) & valid[np.minimum(sa, n - q)])
+    sa_codes = codes[sa[sa_valid]]
+
+    all_codes = np.arange(1 << (2 * q))
+    first = np.searchsorted(sa_codes, all_codes, side='left')
+    last = np.searchsorted(sa_codes, all_codes, side='right')
+    present = last > first
+    buckets[0][present] = sa_valid[first[present]]
+    buckets[1][present] = sa_valid[last[present] - 1] + 1
+    return buckets
+
+
+def _mask_mismatches(mask: int) -> int:
+    """
+    Count non-zero 2-bit fields of a mask produced by 'mismatch_masks()'
+    """
+    result = 0
+    while mask != 0:
+        if mask & 3 != 0:
+            result += 1
+        mask >>= 2
+    return result
+
+
+class GenomeIndex:
+    """
+    A suffix array index of a genome. Build it with 'GenomeIndex.build()' or load with 'GenomeIndex.load()'
+    """
+    def __init__(self, text: np.ndarray, sa: np.ndarray, buckets: np.ndarray):
+        self.text = text
+        self.sa = sa
+        self.buckets = buckets
+        self.q = (buckets.shape[1].bit_length() - 1) // 2
+
+        # Element access through memoryviews is much faster than through (memory-mapped) NumPy arrays
+        self._text = memoryview(np.ascontiguousarray(text))
+        self._sa = memoryview(np.ascontiguousarray(sa)).cast('B').cast('i' if sa.dtype == np.int32 else 'q')
+        self._bucket_starts = memoryview(np.ascontiguousarray(buckets[0])).cast('B').cast('q')
+        self._bucket_ends = memoryview(np.ascontiguousarray(buckets[1])).cast('B').cast('q')
+
+    @staticmethod
+    def build(genome) -> 'GenomeIndex':
+        """
+        Build an index of the given genome ('str' or bytes)
+        """
+        text = _encode_text(genome)
+        sa = build_suffix_array(text)
+        q = 1
+        while q < BUCKETS_Q_MAX and 4 ** (q + 1) <= len(text):
+            q += 1
+        return GenomeIndex(text, sa, _build_buckets(text, sa, q))
+
+    def save(self, prefix: str) -> None:
+        """
+        Save the index into '<prefix>.*.npy' files
+        """
+        for name, array in zip(_INDEX_FILES, (self.text, self.sa, self.buckets)):
+            np.save('{}.{}.npy'.format(prefix, name), array)
+
+    @staticmethod
+    def load(prefix: str) -> 'GenomeIndex':
+        """
+        Load (memory-map) an index saved by 'GenomeIndex.save()'
+        """
+        return GenomeIndex(*[np.load('{}.{}.npy'.format(prefix, name), mmap_mode='r') for name in _INDEX_FILES])
+
+    def _lower_bound(self, lo: int, hi: int, depth: int, c: int) -> int:
+        """
+        Find the first suffix in the range [lo, hi) of the suffix array whose character at 'depth' is not lower than
+        'c'. All suffixes in the range must share a prefix of length 'depth'
+        """
+        text = self._text
+        sa = self._sa
+        n = len(text)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            position = sa[mid] + depth
+            if position < n and text[position] >= c:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def approximate_occurrences(self, pattern: str, mismatches: int) -> list:
+        """
+        Find all positions in the genome where 'pattern' occurs with at most 'mismatches' mismatches.
+
+        The suffix array is traversed by backtracking with a mismatch budget: the first q characters are looked up in
+        the buckets table for every q-mer in the neighbourhood of the pattern prefix, then ranges are narrowed one
+        character at a time. Small ranges are verified directly
+        :param pattern: a pattern of 'A', 'C', 'G', 'T'
+        :return: a sorted list of positions
+        """
+        pattern_codes = encode_genome(pattern)
+        m = len(pattern_codes)
+        n = len(self._text)
+        text = self._text
+        sa = self._sa
+        result = []
+
+        # Stack of (suffix array range start, range end, depth, remaining mismatches)
+        stack = []
+        if m >= self.q:
+            prefix_code = 0
+            for c in pattern_codes[:self.q]:
+                prefix_code = (prefix_code << 2) | c
+            for mask in mismatch_masks(self.q, mismatches):
+                code = prefix_code ^ mask
+                lo, hi = self._bucket_starts[code], self._bucket_ends[code]
+                if lo < hi:
+                    stack.append((lo, hi, self.q, mismatches - _mask_mismatches(mask)))
+        else:
+            stack.append((0, n, 0, mismatches))
+
+        while len(stack) > 0:
+            lo, hi, depth, budget = stack.pop()
+
+            if depth == m:
+                result.extend(sa[lo:hi])
+                continue
+
+            if hi - lo <= VERIFY_RANGE_MAX:
+                for i in range(lo, hi):
+                    start = sa[i]
+                    if start + m > n:
+                        continue
+                    remaining = budget
+                    for j in range(depth, m):
+                        c = text[start + j]
+                        if c != pattern_codes[j]:
+                            remaining = remaining - 1 if c != OTHER_CODE else -1
+                            if remaining < 0:
+                                break
+                    if remaining >= 0:
+                        result.append(start)
+                continue
+
+            c_lo = self._lower_bound(lo, hi, depth, 0)
+            for c in range(4):
+                c_hi = self._lower_bound(c_lo, hi, depth, c + 1)
+                if c_lo < c_hi:
+                    c_budget = budget if c == pattern_codes[depth] else budget - 1
+                    if c_budget >= 0:
+                        stack.append((c_lo, c_hi, depth + 1, c_budget))
+                c_lo = c_hi
+
+        return sorted(result)
+
+
+if __name__ == '__main__':
+    main()
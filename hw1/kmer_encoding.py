@@ -0,0 +1,188 @@
+"""
+2-bit integer encoding of DNA k-mers.
+
+Every base is encoded as a 2-bit code ('A' = 0, 'C' = 1, 'G' = 2, 'T' = 3); a k-mer is a 2k-bit integer with its
+first base in the highest bits. With this order, integer order of k-mer codes is the lexicographic order of k-mers
+"""
+
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations, product
+
+
+CODE_TO_BASE = 'ACGT'
+BASE_TO_CODE = {base: code for code, base in enumerate(CODE_TO_BASE)}
+
+# Largest 'k' for which k-mer counters may be flat arrays of 4**k cells. Above it, counters are sparse dicts
+DENSE_K_MAX = 12
+
+# A counter is a flat array only if it gets at least 4**k / DENSE_SPARSITY_MAX updates: allocating and scanning a mostly
+# empty array costs more than updating a dict
+DENSE_SPARSITY_MAX = 16
+
+# Code of characters other than 'A', 'C', 'G', 'T' in 'encode_bytes()' output
+INVALID_CODE = 0xFF
+_ENCODE_TABLE = bytes(BASE_TO_CODE.get(chr(c), INVALID_CODE) for c in range(256))
+
+
+def encode_bytes(data: bytes) -> bytes:
+    """
+    Encode an ASCII sequence into 2-bit codes, one byte per base. Characters other than 'A', 'C', 'G', 'T' are encoded
+    as INVALID_CODE
+    """
+    return data.translate(_ENCODE_TABLE)
+
+
+def encode_genome(genome: str) -> bytes:
+    """
+    Encode the given genome into 2-bit codes, one byte per base
+    :param genome: sequence to encode
+    :return: codes of the bases of 'genome'
+    :raises ValueError: if 'genome' contains a character other than 'A', 'C', 'G' or 'T'
+    """
+    codes = encode_bytes(genome.encode('ascii'))
+    invalid_at = codes.find(INVALID_CODE)
+    if invalid_at != -1:
+        raise ValueError("Cannot encode character '{}' at position {}".format(genome[invalid_at], invalid_at))
+    return codes
+
+
+def encode_kmer(pattern: str) -> int:
+    """
+    Encode the given k-mer into an integer code
+    """
+    code = 0
+    for c in encode_genome(pattern):
+        code = (code << 2) | c
+    return code
+
+
+def decode_kmer(code: int, k: int) -> str:
+    """
+    Decode an integer k-mer code into a string of length 'k'
+    """
+    result = []
+    for _ in range(k):
+        result.append(CODE_TO_BASE[code & 3])
+        code >>= 2
+    return ''.join(reversed(result))
+
+
+def iter_kmer_codes(codes: bytes, k: int):
+    """
+    Iterate over codes of all k-mers of an encoded genome, using a rolling integer window
+    :param codes: genome encoded by 'encode_genome()'
+    :param k: k-mer length
+    :return: a generator of k-mer codes, in order of k-mer positions
+    """
+    mask = (1 << (2 * k)) - 1
+    code = 0
+    for i, c in enumerate(codes):
+        code = ((code << 2) | c) & mask
+        if i >= k - 1:
+            yield code
+
+
+def count_kmer_codes(codes: bytes, k: int) -> Counter:
+    """
+    Count occurrences of each distinct k-mer of an encoded genome
+    :return: a map: k-mer code -> number of occurrences
+    """
+    return Counter(iter_kmer_codes(codes, k))
+
+
+def _reverse_complement_byte(b: int) -> int:
+    """
+    Get the code of the reverse complement of a 4-mer with code 'b'
+    """
+    result = 0
+    for _ in range(4):
+        result = (result << 2) | (3 - (b & 3))
+        b >>= 2
+    return result
+
+
+_RC_BYTE_TABLE = [_reverse_complement_byte(b) for b in range(256)]
+
+
+def reverse_complement_code(code: int, k: int) -> int:
+    """
+    Get the code of the reverse complement of a k-mer with the given 'code'.
+    Complement of a base is '3 - code'; 4-mers are reversed and complemented by a precomputed table
+    """
+    chunks = (k + 3) // 4
+    result = 0
+    for _ in range(chunks):
+        result = (result << 8) | _RC_BYTE_TABLE[code & 0xFF]
+        code >>= 8
+    # The k-mer was padded with 'A' at its start; these became 'T' at the end of the result
+    return result >> (2 * (4 * chunks - k))
+
+
+@lru_cache(maxsize=64)
+def mismatch_masks(k: int, mismatches: int) -> tuple:
+    """
+    Generate XOR masks turning a k-mer code into codes of all k-mers with at most 'mismatches' mismatches.
+    A mask has a non-zero 2-bit field at each mismatching position; 'code ^ mask' substitutes bases at these positions
+    :return: a tuple of masks, starting with 0 (the k-mer itself). Different masks produce different neighbours
+    """
+    result = [0]
+    for curr_mismatches in range(1, min(mismatches, k) + 1):
+        for positions in combinations(range(k), curr_mismatches):
+            for substitutions in product((1, 2, 3), repeat=curr_mismatches):
+                mask = 0
+                for position, substitution in zip(positions, substitutions):
+                    mask |= substitution << (2 * position)
+                result.append(mask)
+    return tuple(result)
+
+
+def kmer_counter(k: int, dense_k_max: int = DENSE_K_MAX, updates: int = None):
+    """
+    Create an empty counter for k-mer codes: a flat array of 4**k 32-bit cells if 'k' <= 'dense_k_max' and the counter
+    is dense enough (see DENSE_SPARSITY_MAX), a sparse dict otherwise. Both support 'counter[code] += n' for any code
+    :param updates: the maximum number of distinct codes to update, e.g. distinct k-mers times the neighbourhood size;
+    if not given, the array is chosen by 'k' only
+    """
+    if k <= dense_k_max and (updates is None or updates * DENSE_SPARSITY_MAX >= 1 << (2 * k)):
+        return array('I', [0]) * (1 << (2 * k))
+    return Counter()
+
+
+def max_count(counter) -> int:
+    """
+    Get the maximum count in a counter created by 'kmer_counter()' (0 for an empty counter)
+    """
+    if isinstance(counter, array):
+        return max(counter, default=0)
+    return max(counter.values(), default=0)
+
+
+def codes_with_count(counter, count: int) -> list:
+    """
+    Find all k-mer codes which have the given (non-zero) 'count' in a counter created by 'kmer_counter()'
+    :return: a sorted list of codes
+    """
+    if not isinstance(counter, array):
+        return sorted(code for code, code_count in counter.items() if code_count == count)
+
+    result = []
+    code = -1
+    while True:
+        try:
+            code = counter.index(count, code + 1)
+        except ValueError:
+            return result
+        result.append(code)
+
+
+def most_frequent_codes(counter) -> list:
+    """
+    Find the most frequent k-mer codes in a counter created by 'kmer_counter()'
+    :return: a sorted list of codes with the maximum (non-zero) count
+    """
+    count = max_count(counter)
+    if count == 0:
+        return []
+    return codes_with_count(counter, count)
@@ -0,0 +1,217 @@
+"""
+A persistent k-mer count index of a genome, shared by the hw1 tools: build once, query many.
+
+An index file consists of a header and four arrays, and is memory-mapped on load:
+* header: magic, k, genome length, number of distinct k-mers, number of positions, SHA-256 of the genome;
+* codes: sorted codes of distinct k-mers (see 'kmer_encoding'), uint64;
+* counts: numbers of occurrences of the k-mers, uint64;
+* offsets: start of the positions of every k-mer in the positions array (plus the total at the end), uint64;
+* positions: positions of the k-mers, grouped by k-mer and sorted within a group, uint64.
+K-mers containing characters other than 'A', 'C', 'G', 'T' are not indexed
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from kmer_encoding import INVALID_CODE, encode_bytes, mismatch_masks, encode_kmer
+
+
+# Largest k whose k-mer codes fit into uint64
+KMER_K_MAX = 32
+
+_MAGIC = b'KMERIDX1'
+_HEADER = struct.Struct('<8sQQQQ32s')
+
+
+def _genome_bytes(genome) -> bytes:
+    if isinstance(genome, str):
+        return genome.encode('ascii')
+    return bytes(genome)
+
+
+def _check_k(k: int) -> None:
+    if k > KMER_K_MAX:
+        raise ValueError('K-mer codes support k up to {}, got {}'.format(KMER_K_MAX, k))
+
+
+def genome_hash(genome) -> bytes:
+    """
+    Get the content hash (SHA-256) of a genome ('str' or bytes)
+    """
+    return hashlib.sha256(_genome_bytes(genome)).digest()
+
+
+def kmer_code_array(data: bytes, k: int) -> tuple:
+    """
+    Compute codes of all k-mers of an ASCII sequence at once. K-mers containing characters other than 'A', 'C', 'G', 'T'
+    are skipped
+    :param k: k-mer length, at most KMER_K_MAX
+    :return: positions of the k-mers and their codes, both uint64 arrays
+    :raises ValueError: if 'k' exceeds KMER_K_MAX
+    """
+    _check_k(k)
+    text = np.frombuffer(encode_bytes(data), dtype=np.uint8)
+    n = len(text) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64)
+
+    kmer_codes = np.zeros(n, dtype=np.uint64)
+    valid = np.ones(n, dtype=bool)
+    for j in range(k):
+        window = text[j:j + n]
+        kmer_codes <<= np.uint64(2)
+        kmer_codes |= (window & 3).astype(np.uint64)
+        valid &= window != INVALID_CODE
+    return np.flatnonzero(valid).astype(np.uint64), kmer_codes[valid]
+
+
+class KmerIndex:
+    """
+    Distinct k-mers of a genome with their counts and positions. Create it with 'KmerIndex.build()',
+    'KmerIndex.load()' or 'load_or_build_index()'
+    """
+    def __init__(self, k: int, genome_length: int, digest: bytes, codes: np.ndarray, counts: np.ndarray,
+                 offsets: np.ndarray, positions: np.ndarray):
+        self.k = k
+        self.genome_length = genome_length
+        self.digest = digest
+        self.codes = codes
+        self.counts = counts
+        self.offsets = offsets
+        self.positions = positions
+
+    @staticmethod
+    def build(genome, k: int) -> 'KmerIndex':
+        """
+        Index k-mers of the given genome ('str' or bytes)
+        :raises ValueError: if 'k' exceeds KMER_K_MAX
+        """
+        _check_k(k)
+        data = _genome_bytes(genome)
+        kmer_positions, kmer_codes = kmer_code_array(data, k)
+
+        # A stable sort keeps positions of every k-mer in increasing order
+        order = np.argsort(kmer_codes, kind='stable')
+        codes, counts = np.unique(kmer_codes[order], return_counts=True)
+        offsets = np.zeros(len(codes) + 1, dtype=np.uint64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return KmerIndex(
+            k, len(data), hashlib.sha256(data).digest(),
+            codes.astype(np.uint64), counts.astype(np.uint64), offsets, kmer_positions[order]
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write the index into a file
+        """
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.k, self.genome_length, len(self.codes), len(self.positions), self.digest))
+            for array in (self.codes, self.counts, self.offsets, self.positions):
+                f.write(np.ascontiguousarray(array, dtype=np.uint64).tobytes())
+
+    @staticmethod
+    def read_header(path: str) -> tuple:
+        """
+        Read the header of an index file
+        :return: k, genome length, SHA-256 of the genome
+        :raises ValueError: if the file is not an index
+        """
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError('{} is not a k-mer index'.format(path))
+        magic, k, genome_length, _, _, digest = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError('{} is not a k-mer index'.format(path))
+        return k, genome_length, digest
+
+    @staticmethod
+    def load(path: str) -> 'KmerIndex':
+        """
+        Load (memory-map) an index written by 'KmerIndex.save()'
+        """
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, k, genome_length, total_kmers, total_positions, digest = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError('{} is not a k-mer index'.format(path))
+
+        arrays = []
+        offset = _HEADER.size
+        for length in (total_kmers, total_kmers, total_kmers + 1, total_positions):
+            arrays.append(np.frombuffer(data, dtype=np.uint64, count=length, offset=offset))
+            offset += 8 * length
+        return KmerIndex(k, genome_length, digest, *arrays)
+
+    def kmer_counts(self):
+        """
+        Iterate over (code, count) of all distinct k-mers, in increasing order of code
+        """
+        return zip(self.codes.tolist(), self.counts.tolist())
+
+    def _find(self, codes: np.ndarray) -> tuple:
+        """
+        Find ranges of positions of the given k-mer codes
+        :return: starts and ends of the ranges in the positions array (empty ranges for absent k-mers)
+        """
+        codes = np.asarray(codes, dtype=np.uint64)
+        i = np.searchsorted(self.codes, codes)
+        present = i < len(self.codes)
+        present[present] = self.codes[i[present]] == codes[present]
+        i = i[present]
+        return self.offsets[i], self.offsets[i + 1]
+
+    def occurrences(self, pattern: str, mismatches: int = 0) -> list:
+        """
+        Find all positions where 'pattern' (of length k, of 'A', 'C', 'G', 'T') occurs with at most 'mismatches'
+        mismatches. Neighbours are looked up as integer codes
+        :return: a sorted list of positions
+        """
+        if len(pattern) != self.k:
+            raise ValueError('The index is built for k = {}, but the pattern length is {}'.format(self.k, len(pattern)))
+        code = encode_kmer(pattern)
+        starts, ends = self._find([code ^ mask for mask in mismatch_masks(self.k, mismatches)])
+        if len(starts) == 0:
+            return []
+        result = np.concatenate([self.positions[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+        return np.sort(result).tolist()
+
+    def clump_codes(self, l: int, t: int) -> np.ndarray:
+        """
+        Find codes of k-mers occurring at least 't' times in some window of 'l' bases
+        :return: a sorted array of codes
+        """
+        if t < 1 or l < self.k or len(self.positions) < t:
+            return np.zeros(0, dtype=np.uint64)
+        # Positions of a k-mer are consecutive and sorted; 't' of them fit into a window if the first and the last
+        # of them are at most 'l' - 'k' bases apart
+        first = self.positions[:len(self.positions) - t + 1].astype(np.int64)
+        last = self.positions[t - 1:].astype(np.int64)
+        kmer_of_position = np.repeat(np.arange(len(self.codes)), self.counts.astype(np.int64))
+        in_clump = (kmer_of_position[t - 1:] == kmer_of_position[:len(first)]) & (last - first <= l - self.k)
+        return self.codes[np.unique(kmer_of_position[:len(first)][in_clump])]
+
+
+def load_or_build_index(path: str, genome, k: int) -> KmerIndex:
+    """
+    Load the index at 'path' if it was built for the same genome (by content hash) and 'k'; otherwise build the index
+    and write it to 'path'
+    :raises ValueError: if 'k' exceeds KMER_K_MAX
+    """
+    _check_k(k)
+    if os.path.exists(path):
+        try:
+            index_k, index_genome_length, digest = KmerIndex.read_header(path)
+        except ValueError:
+            index_k = None
+        if index_k == k and index_genome_length == len(genome) and digest == genome_hash(genome):
+            return KmerIndex.load(path)
+
+    index = KmerIndex.build(genome, k)
+    index.save(path)
+    return index
@@ -1,16 +1,82 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
+import sys
+import time
 from collections import deque
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from kmer_encoding import INVALID_CODE, encode_bytes, decode_kmer
+from kmer_index import KMER_K_MAX, KmerIndex, load_or_build_index
+from result_writer import write_items
+from sequence_io import CHUNK_SIZE, iter_records
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Find (L, t)-clumps of k-mers')
+    # Each of these options selects a way to find clumps which does not use the others
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--genome-file',
+        help='stream the genome (FASTA or raw sequence) from this file instead of standard input; '
+             'standard input then only contains "k l t"'
+    )
+    mode.add_argument(
+        '--max-k', type=int,
+        help='find clumps for every pattern length from k to MAX_K in one pass; they are printed one line per length'
+    )
+    mode.add_argument(
+        '--workers', type=int, default=None,
+        help='find clumps in this number of processes, splitting the genome into overlapping shards '
+             '(0 means the number of CPUs)'
+    )
+    mode.add_argument(
+        '--kmer-index',
+        help='find clumps with the k-mer index file at this path, built (or rebuilt if the genome or k changed) on demand'
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=CHUNK_SIZE, help='size of a chunk of the genome file to read at once, in bytes'
+    )
+    args = parser.parse_args()
+
+    if args.genome_file is not None:
+        k, l, t = list(map(int, input().split()))
+
+        stats = {}
+        time_start = time.perf_counter()
+        write_items(stream_l_t_clumps(args.genome_file, k, l, t, args.chunk_size, stats), flush=True)
+        time_spent = time.perf_counter() - time_start
+
+        print(
+            'Processed {} bases in {:.2f} s ({:.0f} bases/sec)'.format(
+                stats['bases'], time_spent, stats['bases'] / time_spent if time_spent > 0 else 0.
+            ),
+            file=sys.stderr
+        )
+        return
+
     genome = input().upper()
     k, l, t = list(map(int, input().split()))
 
-    clumps = l_t_clumps(genome, k, l, t)
-    for c in clumps:
-        print(c, end=' ')
-    print()
+    if args.max_k is not None:
+        for curr_k, clumps in multi_k_l_t_clumps(genome, range(k, args.max_k + 1), l, t).items():
+            write_items(clumps, '{}: '.format(curr_k))
+        return
+
+    if args.kmer_index is not None and k > KMER_K_MAX:
+        print('The k-mer index supports k up to {}, scanning the genome instead'.format(KMER_K_MAX), file=sys.stderr)
+        args.kmer_index = None
+    if args.kmer_index is not None:
+        clumps = indexed_l_t_clumps(load_or_build_index(args.kmer_index, genome, k), l, t)
+    elif args.workers is None:
+        clumps = iter_clumps(genome, k, l, t)
+    else:
+        clumps = parallel_l_t_clumps(genome, k, l, t, args.workers if args.workers > 0 else None)
+    write_items(clumps, flush=True)
 
 
 def l_t_clumps(genome: str, k: int, l: int, t: int):
@@ -22,6 +88,15 @@ def l_t_clumps(genome: str, k: int, l: int, t: int):
     :param t: number of occurrences
     :return: a list containing all the named patterns
     """
+    return list(iter_clumps(genome, k, l, t))
+
+
+def iter_clumps(genome: str, k: int, l: int, t: int):
+    """
+    Find patterns of length 'k' occurring at least 't' times in some substring of length 'l' of 'genome', producing
+    them while the scan goes on
+    :return: a generator of patterns, each one produced once, as soon as it is found
+    """
     clump_set = set()
 
     pqueue_size_max = l - k + 1
@@ -42,10 +117,243 @@ def l_t_clumps(genome: str, k: int, l: int, t: int):
         pqueue.append(seq_current)
         pdict[seq_current] = pdict.get(seq_current, 0) + 1
 
-        if pdict[seq_current] >= t:
+        if pdict[seq_current] >= t and seq_current not in clump_set:
             clump_set.add(seq_current)
+            yield seq_current
+
+
+def indexed_l_t_clumps(index: KmerIndex, l: int, t: int) -> list:
+    """
+    Find patterns of length 'index.k' occurring at least 't' times in some substring of length 'l' of the genome of a
+    k-mer index, without scanning the genome. K-mers containing characters other than 'A', 'C', 'G', 'T' are ignored
+    :return: a list containing all the named patterns
+    """
+    return [decode_kmer(int(code), index.k) for code in index.clump_codes(l, t)]
+
+
+def _clump_codes(chunks, k: int, l: int, t: int, found: set, stats: dict):
+    """
+    Find (l, t)-clumps in a sequence given by chunks, keeping the window as rolling integer k-mer codes in a ring buffer.
+    K-mers containing characters other than 'A', 'C', 'G', 'T' are not counted
+    :param chunks: an iterable of chunks of the sequence (ASCII bytes)
+    :param found: codes of clumps found earlier; new clumps are added to it
+    :param stats: a dict whose 'bases' entry is increased by the number of bases processed
+    :return: a generator of codes of clumps not in 'found', as soon as they are found
+    """
+    window_size = l - k + 1
+    # Codes of k-mers in the window, indexed by k-mer position modulo 'window_size'; -1 marks an invalid k-mer
+    ring = [-1] * window_size
+    counts = {}
+
+    mask = (1 << (2 * k)) - 1
+    code = 0
+    valid_bases = 0
+    position = -k  # Position of the k-mer ending at the current base
+
+    for chunk in chunks:
+        stats['bases'] = stats.get('bases', 0) + len(chunk)
+        for c in encode_bytes(chunk):
+            position += 1
+            if c == INVALID_CODE:
+                valid_bases = 0
+            else:
+                code = ((code << 2) | c) & mask
+                valid_bases += 1
+            if position < 0:
+                continue
+
+            slot = position % window_size
+            code_previous = ring[slot]
+            if code_previous != -1:
+                if counts[code_previous] == 1:
+                    counts.pop(code_previous)
+                else:
+                    counts[code_previous] -= 1
+
+            if valid_bases < k:
+                ring[slot] = -1
+                continue
+
+            ring[slot] = code
+            count = counts.get(code, 0) + 1
+            counts[code] = count
+            if count >= t and code not in found:
+                found.add(code)
+                yield code
+
+
+def stream_l_t_clumps(path: str, k: int, l: int, t: int, chunk_size: int = CHUNK_SIZE, stats: dict = None):
+    """
+    Find patterns of length 'k' occurring at least 't' times in some substring of length 'l' of a genome in a file.
+
+    The file (FASTA or raw sequence) is read in chunks through mmap, so memory does not depend on the genome length.
+    Windows do not span FASTA records. K-mers containing characters other than 'A', 'C', 'G', 'T' are ignored
+    :param path: path to the genome file
+    :param chunk_size: size of a chunk of the file to read at once
+    :param stats: if given, its 'bases' entry is set to the number of bases processed
+    :return: a generator of patterns, each one produced once, as soon as it is found
+    """
+    if stats is None:
+        stats = {}
+    stats['bases'] = 0
+
+    found = set()
+    for _, chunks in iter_records(path, chunk_size):
+        for code in _clump_codes(chunks, k, l, t, found, stats):
+            yield decode_kmer(code, k)
+
+
+def _prefix_codes(codes: np.ndarray, k_max: int) -> np.ndarray:
+    """
+    Compute codes of the k_max-mers starting at every position of an encoded genome, as if the genome was padded with
+    'A' at the end. The code of the k-mer starting at a position is 'result >> 2 * (k_max - k)' for every k <= k_max
+    :param k_max: at most KMER_K_MAX
+    """
+    padded = np.zeros(len(codes) + k_max - 1, dtype=np.uint64)
+    padded[:len(codes)] = codes & 3
+    result = np.zeros(len(codes), dtype=np.uint64)
+    for j in range(k_max):
+        result <<= np.uint64(2)
+        result |= padded[j:j + len(codes)]
+    return result
+
+
+def _sorted_clump_codes(kmer_codes: np.ndarray, positions: np.ndarray, k: int, l: int, t: int) -> np.ndarray:
+    """
+    Find codes of k-mers occurring at least 't' times within 'l' bases
+    :param kmer_codes: codes of the k-mers at 'positions'
+    :param positions: k-mer positions, in increasing order
+    :return: a sorted array of distinct codes
+    """
+    if len(kmer_codes) < t:
+        return np.zeros(0, dtype=np.uint64)
+    order = np.argsort(kmer_codes, kind='stable')
+    codes_sorted = kmer_codes[order]
+    positions_sorted = positions[order]
+    # Occurrences of a k-mer are consecutive and in increasing order of position; 't' of them are in a window of 'l'
+    # bases if the first and the last of them start at most 'l' - 'k' bases apart
+    in_clump = (codes_sorted[t - 1:] == codes_sorted[:len(codes_sorted) - t + 1]) & \
+        (positions_sorted[t - 1:] - positions_sorted[:len(positions_sorted) - t + 1] <= l - k)
+    return np.unique(codes_sorted[:len(in_clump)][in_clump])
+
+
+def multi_k_l_t_clumps(genome: str, ks, l: int, t: int) -> dict:
+    """
+    Find patterns of length 'k' occuring at leats 't' times in each (continuous) substring of length 'l', for every 'k'
+    in 'ks', in one traversal of the genome.
+
+    The genome is encoded once into codes of the longest k-mers starting at every position; codes of shorter k-mers
+    are their prefixes, obtained by a shift. For every 'k', occurrences are sorted by code (keeping them in order of
+    position), and a k-mer is a clump if some 't' consecutive occurrences of it fit into 'l' bases.
+
+    Every prefix of a clump is a clump as well (its occurrences are even closer relative to the window). So lengths are
+    processed in increasing order, and only occurrences of clumps of the previous length remain candidates for the
+    next one: all but the shortest length usually process a small fraction of the genome.
+
+    Codes of k-mers longer than KMER_K_MAX do not fit into uint64; clumps of such lengths are found by 'iter_clumps()',
+    one length at a time.
+
+    For genomes of 'A', 'C', 'G', 'T' the result for every 'k' is the same as of 'l_t_clumps()'; k-mers containing
+    other characters are ignored
+    :param ks: pattern lengths
+    :return: a map: k -> a sorted list containing all the named patterns
+    """
+    ks = sorted(set(ks))
+    result = {k: [] for k in ks}
+    if len(ks) == 0 or t < 1:
+        return result
+
+    for k in ks:
+        if k > KMER_K_MAX:
+            result[k] = sorted(iter_clumps(genome, k, l, t))
+    ks = [k for k in ks if k <= KMER_K_MAX]
+    if len(ks) == 0:
+        return result
+
+    codes = np.frombuffer(encode_bytes(genome.encode('ascii')), dtype=np.uint8)
+    k_max = ks[-1]
+    prefix_codes = _prefix_codes(codes, k_max)
+    invalid_before = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(codes == INVALID_CODE, out=invalid_before[1:])
+
+    # Positions of k-mers which may be clumps
+    candidates = np.arange(len(codes))
+    for k in ks:
+        if l < k:
+            break
+        candidates = candidates[candidates <= len(codes) - k]
+        candidates = candidates[invalid_before[candidates + k] == invalid_before[candidates]]
+
+        kmer_codes = prefix_codes[candidates] >> np.uint64(2 * (k_max - k))
+        clump_codes = _sorted_clump_codes(kmer_codes, candidates, k, l, t)
+        result[k] = [decode_kmer(int(code), k) for code in clump_codes]
+
+        candidates = candidates[np.isin(kmer_codes, clump_codes)]
+
+    return result
+
+
+# Genome shared with worker processes of 'parallel_l_t_clumps()'
+_shared_genome = None
+
+
+def _attach_shared_genome(name: str) -> None:
+    """
+    Initialize a worker process of 'parallel_l_t_clumps()'
+    """
+    global _shared_genome
+    _shared_genome = SharedMemory(name=name)
+
+
+def _shard_clump_codes(shard: tuple) -> list:
+    """
+    Find codes of clumps in a shard (start, end, k, l, t) of the shared genome
+    """
+    start, end, k, l, t = shard
+    chunks = (
+        bytes(_shared_genome.buf[chunk_start:min(chunk_start + CHUNK_SIZE, end)])
+        for chunk_start in range(start, end, CHUNK_SIZE)
+    )
+    return list(_clump_codes(chunks, k, l, t, set(), {}))
+
+
+def parallel_l_t_clumps(genome: str, k: int, l: int, t: int, workers: int = None, shards_per_worker: int = 4) -> list:
+    """
+    Find patterns of length 'k' occuring at leats 't' times in each (continuous) substring of length 'l', using a pool
+    of processes.
+
+    The genome is placed into shared memory and split into shards overlapping by 'l' - 1 bases, so that every window
+    of length 'l' is entirely inside some shard. Workers run the sliding-window counter over shards; clump sets of
+    shards are merged. For genomes of 'A', 'C', 'G', 'T' the result is the same as of 'l_t_clumps()'; k-mers containing
+    other characters are ignored
+    :param workers: number of processes; the number of CPUs by default
+    :param shards_per_worker: number of shards to split the genome into per worker, to balance the load
+    :return: a list containing all the named patterns
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    data = genome.encode('ascii')
+    if len(data) < k:
+        return []
+
+    shard_step = max(-(-len(data) // (workers * shards_per_worker)), l)
+    shards = [
+        (start, min(start + shard_step + l - 1, len(data)), k, l, t)
+        for start in range(0, max(len(data) - l, 0) + 1, shard_step)
+    ]
+
+    shared_genome = SharedMemory(create=True, size=len(data))
+    try:
+        shared_genome.buf[:len(data)] = data
+        with Pool(min(workers, len(shards)), initializer=_attach_shared_genome, initargs=(shared_genome.name,)) as pool:
+            clump_set = set()
+            for shard_codes in pool.imap_unordered(_shard_clump_codes, shards):
+                clump_set.update(shard_codes)
+    finally:
+        shared_genome.close()
+        shared_genome.unlink()
 
-    return list(clump_set)
+    return [decode_kmer(code, k) for code in clump_set]
 
 
 if __name__ == '__main__':
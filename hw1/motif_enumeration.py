@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from kmer_encoding import decode_kmer, mismatch_masks
+from kmer_index import kmer_code_array
+from result_writer import write_items
+
+
+def main():
+    k, mismatches = list(map(int, input().split()))
+    genomes = []
+    while True:
+        try:
+            line = input().strip()
+        except EOFError:
+            break
+        if len(line) > 0:
+            genomes.append(line.upper())
+
+    write_items(motif_enumeration(genomes, k, mismatches))
+
+
+# Codes of k-mers are split into containers of 2**CONTAINER_BITS consecutive codes by their high bits; neighbourhoods
+# are intersected one container at a time
+CONTAINER_BITS = 22
+
+# Maximum number of neighbours marked at once
+NEIGHBOURS_CHUNK_SIZE = 1 << 22
+
+
+def _group_by_high_bits(values: np.ndarray, low_bits: int) -> dict:
+    """
+    Split values by their bits above the lowest 'low_bits'
+    :return: a dict from high bits to a sorted array of low bits of values which have them
+    """
+    values = np.unique(values)
+    if len(values) == 0:
+        return {}
+    high = values >> np.uint64(low_bits)
+    low = values & np.uint64((1 << low_bits) - 1)
+    bounds = np.flatnonzero(np.diff(high)) + 1
+    return {
+        int(high[start]): low[start:end]
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(values)])))
+    }
+
+
+def _neighbourhood_bits(code_groups: dict, mask_groups: dict, container: int, scratch: np.ndarray) -> np.ndarray:
+    """
+    Mark neighbours of k-mers of one string which fall into a container.
+    A neighbour 'code ^ mask' has high bits 'code_high ^ mask_high', so only codes with high bits 'container ^ mask_high'
+    are combined with masks with high bits 'mask_high'
+    :param code_groups: codes of k-mers of the string, grouped by '_group_by_high_bits()'
+    :param mask_groups: XOR masks, grouped by '_group_by_high_bits()'
+    :param scratch: a bool array of the container size, overwritten
+    :return: the bitset of the neighbours in the container (a bit per code, in little bit order)
+    """
+    scratch[:] = False
+    for mask_high, mask_low in mask_groups.items():
+        code_low = code_groups.get(container ^ mask_high)
+        if code_low is None:
+            continue
+        rows = max(NEIGHBOURS_CHUNK_SIZE // len(mask_low), 1)
+        for start in range(0, len(code_low), rows):
+            scratch[(code_low[start:start + rows, np.newaxis] ^ mask_low[np.newaxis]).ravel()] = True
+    return np.packbits(scratch, bitorder='little')
+
+
+def motif_enumeration(genomes: list, k: int, mismatches: int) -> list:
+    """
+    Find all (k, d)-motifs: patterns of length 'k' which occur in every one of 'genomes' with at most 'mismatches'
+    mismatches.
+
+    The d-neighbourhood of every string is a bitset over codes of all 4**k k-mers (see 'kmer_encoding'), filled with
+    'code ^ mask' for precomputed XOR masks; the motifs are the intersection of these bitsets. The code space is
+    processed one container at a time (see CONTAINER_BITS), and a container is dropped as soon as its intersection is
+    empty, so memory does not depend on 'k'. K-mers containing characters other than 'A', 'C', 'G', 'T' are skipped
+    :param k: pattern length, at most KMER_K_MAX
+    :return: a list of motifs, sorted
+    """
+    if len(genomes) == 0:
+        return []
+    container_bits = min(2 * k, CONTAINER_BITS)
+    mask_groups = _group_by_high_bits(np.array(mismatch_masks(k, mismatches), dtype=np.uint64), container_bits)
+    code_groups = [_group_by_high_bits(kmer_code_array(genome.encode('ascii'), k)[1], container_bits)
+                   for genome in genomes]
+    scratch = np.zeros(1 << container_bits, dtype=bool)
+
+    result = []
+    for container in range(1 << (2 * k - container_bits)):
+        motifs = None
+        for string_code_groups in code_groups:
+            bits = _neighbourhood_bits(string_code_groups, mask_groups, container, scratch)
+            if motifs is None:
+                motifs = bits
+            else:
+                motifs &= bits
+            if not motifs.any():
+                break
+        else:
+            codes = np.flatnonzero(np.unpackbits(motifs, bitorder='little')) + (container << container_bits)
+            result.extend(decode_kmer(int(code), k) for code in codes)
+
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Mismatch neighbourhoods of genome patterns, shared by the hw1 tools.
+
+Neighbourhoods built by 'generate_neighbours()' are kept in a size-bounded LRU cache keyed by (pattern, mismatches),
+so repeated k-mers (common in low-complexity genomes) do not rebuild the same neighbourhood
+"""
+
+from collections import OrderedDict, namedtuple
+from itertools import combinations, product
+
+
+LIST_A = ['C', 'T', 'G']
+LIST_C = ['A', 'T', 'G']
+LIST_T = ['C', 'A', 'G']
+LIST_G = ['C', 'T', 'A']
+
+SUBSTITUTIONS = {
+    'A': LIST_A,
+    'C': LIST_C,
+    'T': LIST_T,
+    'G': LIST_G,
+}
+
+# Default maximum number of neighbourhoods kept in the cache
+CACHE_SIZE = 1024
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _LRUCache:
+    """
+    A size-bounded map which evicts the least recently used entry, counting hits and misses
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the cached value for 'key', or None
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+_cache = _LRUCache(CACHE_SIZE)
+
+
+def cache_info() -> CacheInfo:
+    """
+    Get statistics of the neighbourhood cache
+    """
+    return CacheInfo(_cache.hits, _cache.misses, _cache.maxsize, len(_cache.entries))
+
+
+def set_cache_size(maxsize: int) -> None:
+    """
+    Change the maximum number of cached neighbourhoods (0 disables caching), evicting entries if necessary
+    """
+    _cache.maxsize = maxsize
+    while len(_cache.entries) > max(maxsize, 0):
+        _cache.entries.popitem(last=False)
+
+
+def clear_cache() -> None:
+    """
+    Drop all cached neighbourhoods and reset the statistics
+    """
+    _cache.entries.clear()
+    _cache.hits = 0
+    _cache.misses = 0
+
+
+def _generate_immediate_neighbours(pattern: str) -> list:
+    """
+    Generate immediate (different by one mismatch) neighbours of the given genome pattern
+    :param pattern: a pattern to examine
+    :return: neighbourhood, NOT including the given pattern
+    """
+    generated = []
+    for i in range(len(pattern)):
+        for c in SUBSTITUTIONS.get(pattern[i], ()):
+            generated.append(pattern[:i] + c + pattern[i + 1:])
+
+    return generated
+
+
+def _build_neighbourhood(pattern: str, mismatches: int) -> frozenset:
+    """
+    Build the neighbourhood of 'pattern' by extending it one mismatch at a time
+    """
+    neighbourhood = set()
+    neighbourhood.add(pattern)
+
+    curr_patterns = [pattern]
+    next_patterns = []
+
+    for curr_mismatches in range(mismatches):
+        for curr_pattern in curr_patterns:
+            for neighbour in _generate_immediate_neighbours(curr_pattern):
+                if neighbour not in neighbourhood:
+                    neighbourhood.add(neighbour)
+                    next_patterns.append(neighbour)
+
+        curr_patterns = next_patterns
+        next_patterns = []
+
+    return frozenset(neighbourhood)
+
+
+def generate_neighbours(pattern: str, mismatches: int) -> frozenset:
+    """
+    Generate neighbours for the given pattern (genome string). The result is cached
+    :param pattern: genome pattern
+    :param mismatches: number of mismatches to generate neighbours
+    :return: a set of patterns in the neighbourhood, including the 'pattern' itself
+    """
+    key = (pattern, mismatches)
+    neighbourhood = _cache.get(key)
+    if neighbourhood is None:
+        neighbourhood = _build_neighbourhood(pattern, mismatches)
+        _cache.put(key, neighbourhood)
+    return neighbourhood
+
+
+def iter_neighbours(pattern: str, mismatches: int):
+    """
+    Iterate over neighbours of the given pattern (genome string) without materializing the neighbourhood.
+    Each neighbour is produced exactly once: a neighbour with 'j' mismatches is generated only from the set of
+    positions it differs at
+    :param pattern: genome pattern
+    :param mismatches: number of mismatches to generate neighbours
+    :return: a generator of patterns in the neighbourhood, starting with the 'pattern' itself
+    """
+    yield pattern
+
+    for curr_mismatches in range(1, min(mismatches, len(pattern)) + 1):
+        for positions in combinations(range(len(pattern)), curr_mismatches):
+            neighbour = list(pattern)
+            for substitutes in product(*[SUBSTITUTIONS.get(pattern[i], ()) for i in positions]):
+                for i, c in zip(positions, substitutes):
+                    neighbour[i] = c
+                yield ''.join(neighbour)
@@ -0,0 +1,40 @@
+"""
+Buffered output of results of the hw1 tools: a line of items, each one followed by a space
+"""
+
+import sys
+from itertools import islice
+
+
+# Number of items formatted and written at once
+WRITE_BATCH_SIZE = 4096
+
+
+def write_items(items, prefix: str = '', file=None, batch_size: int = WRITE_BATCH_SIZE, flush: bool = False) -> None:
+    """
+    Write a line 'prefix' 'item1 item2 ... itemN ' (the format of 'print(item, end=' ')' for every item followed by
+    'print()'), formatting items in batches
+    :param items: an iterable of items; a generator is consumed as it produces items
+    :param file: a text stream to write to; standard output if not given
+    :param flush: flush the stream after every batch and after the line, so that results of a long computation appear as
+    they are found. Items of an iterator (e.g. a generator) are then written one at a time, as soon as each one is
+    produced, instead of waiting for a full batch
+    """
+    if file is None:
+        file = sys.stdout
+
+    file.write(prefix)
+    iterator = iter(items)
+    if flush and iterator is items:
+        batch_size = 1
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            break
+        file.write(' '.join(map(str, batch)))
+        file.write(' ')
+        if flush:
+            file.flush()
+    file.write('\n')
+    if flush:
+        file.flush()
@@ -0,0 +1,78 @@
+"""
+Reading genomes (FASTA or raw sequence) from files in fixed-size chunks through mmap
+"""
+
+import mmap
+from itertools import groupby
+
+
+# Default size of a chunk of a file to process at once, in bytes
+CHUNK_SIZE = 1 << 20
+
+_UPPERCASE_TABLE = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_WHITESPACE = b' \t\r\n'
+
+
+def _iter_tagged_chunks(path: str, chunk_size: int):
+    """
+    Iterate over chunks of sequence in the file at 'path'
+    :return: a generator of (record number, record name, chunk). Every record starts with an empty chunk
+    """
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            record = 0
+            name = None
+            yield record, name, b''
+
+            pos = 0
+            while pos < len(data):
+                if data[pos] == ord('>') and (pos == 0 or data[pos - 1] == ord('\n')):
+                    header_end = data.find(b'\n', pos)
+                    if header_end == -1:
+                        header_end = len(data)
+                    record += 1
+                    name = data[pos + 1:header_end].decode().strip()
+                    yield record, name, b''
+                    pos = header_end + 1
+                    continue
+
+                end = min(pos + chunk_size, len(data))
+                next_header = data.find(b'\n>', pos, end + 1)
+                if next_header != -1:
+                    end = next_header + 1
+                yield record, name, data[pos:end].translate(_UPPERCASE_TABLE, _WHITESPACE)
+                pos = end
+
+
+def iter_records(path: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Iterate over records of a FASTA file (or a raw sequence file, which is a single record named None).
+    Sequence is read in chunks of at most 'chunk_size' bytes, uppercased and stripped of whitespace
+    :return: a generator of (record name, generator of sequence chunks). Chunks of a record must be consumed before
+    the next record is requested
+    """
+    for (_, name), group in groupby(_iter_tagged_chunks(path, chunk_size), key=lambda tagged: tagged[:2]):
+        chunks = (chunk for _, _, chunk in group if len(chunk) > 0)
+        if name is None:
+            # Text before the first header of a FASTA file is not a record, unless there is no header at all
+            first = next(chunks, None)
+            if first is None:
+                continue
+            yield name, _prepend(first, chunks)
+        else:
+            yield name, chunks
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def iter_sequence_chunks(path: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Iterate over chunks of sequence of all records of a FASTA (or raw sequence) file, ignoring record boundaries
+    """
+    for _, chunks in iter_records(path, chunk_size):
+        yield from chunks
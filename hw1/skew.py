@@ -1,17 +1,176 @@
 #!/usr/bin/env python3
 
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from result_writer import write_items
+from sequence_io import CHUNK_SIZE, iter_records
+
 
 SKEW_DECREASER = 'C'
 SKEW_INCREASER = 'G'
 
 
 def main():
-    genome = input().upper()
+    parser = argparse.ArgumentParser(description='Find positions of minimum skew')
+    parser.add_argument(
+        '--fasta',
+        help='analyze every record of this FASTA (or raw sequence) file instead of a genome from standard input'
+    )
+    parser.add_argument('--profile-step', type=int, help='also print skew at every PROFILE_STEP-th position')
+    parser.add_argument('--gc-window', type=int, help='also print GC content of windows of GC_WINDOW bases')
+    args = parser.parse_args()
+
+    if args.fasta is None:
+        genome = input().upper()
+
+        write_items(iter_min_skew_positions(genome))
+        return
+
+    for report in skew_fasta(args.fasta, args.profile_step, args.gc_window):
+        if report.name is not None:
+            print('>' + report.name)
+        print(*report.min_positions)
+        if report.profile is not None:
+            print(*report.profile)
+        if report.gc_content is not None:
+            print(*['{:.4f}'.format(gc) for gc in report.gc_content])
+
+
+# Skew change caused by every byte of the sequence
+_SKEW_DELTAS = np.zeros(256, dtype=np.int8)
+_SKEW_DELTAS[[ord(SKEW_INCREASER), ord(SKEW_INCREASER.lower())]] = 1
+_SKEW_DELTAS[[ord(SKEW_DECREASER), ord(SKEW_DECREASER.lower())]] = -1
+
+# 1 for bytes which are G or C
+_GC = np.zeros(256, dtype=np.uint8)
+_GC[[ord(c) for c in 'GCgc']] = 1
+
+
+def _as_bytes_view(genome) -> np.ndarray:
+    """
+    Get a 'uint8' view of the given genome ('str' or a bytes-like object)
+    """
+    if isinstance(genome, str):
+        genome = genome.encode('ascii')
+    return np.frombuffer(genome, dtype=np.uint8)
+
+
+def skew_array(genome) -> np.ndarray:
+    """
+    Calculate skew of every prefix of the genome
+    :param genome: string or bytes to examine
+    :return: an array of length len(genome) + 1, whose i-th element is the skew of the prefix of length i
+    """
+    result = np.zeros(len(genome) + 1, dtype=np.int64)
+    np.cumsum(_SKEW_DELTAS[_as_bytes_view(genome)], out=result[1:])
+    return result
+
+
+SkewReport = namedtuple('SkewReport', ['name', 'length', 'min_skew', 'min_positions', 'profile', 'gc_content'])
+
+
+class _SkewAccumulator:
+    """
+    Skew statistics of a sequence which is given chunk by chunk
+    """
+    def __init__(self, profile_step: int = None, gc_window: int = None):
+        self.profile_step = profile_step
+        self.gc_window = gc_window
 
-    min_skews = min_skew_positions(genome)
-    for c in min_skews:
-        print(c, end=' ')
-    print()
+        self.length = 0
+        self.skew = 0
+        self.min_skew = 0
+        self.min_positions = [np.zeros(1, dtype=np.int64)]
+        self.profile = [np.zeros(1, dtype=np.int64)] if profile_step is not None else None
+        self.gc_content = [] if gc_window is not None else None
+        self.gc_count = 0
+        self.gc_count_window_start = 0
+
+    def add(self, chunk) -> None:
+        """
+        Process the next chunk of the sequence
+        """
+        chunk = _as_bytes_view(chunk)
+        if len(chunk) == 0:
+            return
+        # Positions (prefix lengths) the chunk skews belong to are 'self.length + 1 + i'
+        skews = np.cumsum(_SKEW_DELTAS[chunk], dtype=np.int64)
+        skews += self.skew
+
+        chunk_min_skew = skews.min()
+        if chunk_min_skew <= self.min_skew:
+            if chunk_min_skew < self.min_skew:
+                self.min_skew = chunk_min_skew
+                self.min_positions = []
+            self.min_positions.append(np.flatnonzero(skews == chunk_min_skew) + (self.length + 1))
+
+        if self.profile_step is not None:
+            self.profile.append(skews[(-(self.length + 1)) % self.profile_step::self.profile_step])
+
+        if self.gc_window is not None:
+            gc_counts = np.cumsum(_GC[chunk], dtype=np.int64)
+            gc_counts += self.gc_count
+            window_ends = gc_counts[(-(self.length + 1)) % self.gc_window::self.gc_window]
+            if len(window_ends) > 0:
+                self.gc_content.append(np.diff(window_ends, prepend=self.gc_count_window_start) / self.gc_window)
+                self.gc_count_window_start = window_ends[-1]
+            self.gc_count = gc_counts[-1]
+
+        self.skew = skews[-1]
+        self.length += len(chunk)
+
+    def report(self, name: str = None) -> SkewReport:
+        gc_content = None
+        if self.gc_window is not None:
+            tail = self.length % self.gc_window
+            if tail > 0:
+                self.gc_content.append(np.array([(self.gc_count - self.gc_count_window_start) / tail]))
+            gc_content = np.concatenate(self.gc_content) if len(self.gc_content) > 0 else np.zeros(0)
+
+        return SkewReport(
+            name=name,
+            length=self.length,
+            min_skew=int(self.min_skew),
+            min_positions=np.concatenate(self.min_positions).tolist(),
+            profile=np.concatenate(self.profile) if self.profile is not None else None,
+            gc_content=gc_content,
+        )
+
+
+def skew_report(genome, profile_step: int = None, gc_window: int = None) -> SkewReport:
+    """
+    Analyze skew of the given genome
+    :param genome: string or bytes to examine
+    :param profile_step: if given, the report contains a skew profile: skew at positions 0, step, 2 * step, ...
+    :param gc_window: if given, the report contains GC content (fraction) of consecutive windows of this length; the
+    last window may be shorter
+    :return: a report; 'min_positions' are prefix lengths at which skew is minimal
+    """
+    accumulator = _SkewAccumulator(profile_step, gc_window)
+    accumulator.add(genome)
+    return accumulator.report()
+
+
+def skew_fasta(path: str, profile_step: int = None, gc_window: int = None, chunk_size: int = CHUNK_SIZE) -> list:
+    """
+    Analyze skew of every record of a FASTA (or raw sequence) file in one call.
+    The file is memory-mapped and processed in chunks, so it may be larger than RAM
+    :param path: path to the file
+    :param profile_step: see 'skew_report()'
+    :param gc_window: see 'skew_report()'
+    :param chunk_size: size of a chunk of the file to process at once, in bytes
+    :return: a list of reports, one per record
+    """
+    result = []
+    for name, chunks in iter_records(path, chunk_size):
+        accumulator = _SkewAccumulator(profile_step, gc_window)
+        for chunk in chunks:
+            accumulator.add(chunk)
+        result.append(accumulator.report(name))
+    return result
 
 
 def min_skew_positions(genome: str) -> list:
@@ -21,26 +180,42 @@ def min_skew_positions(genome: str) -> list:
     :return: a list with all indexes where skew is minimized
     """
 
-    min_skew = 0
-    result = [0]
+    skew = skew_array(genome)
+    return np.flatnonzero(skew == skew.min()).tolist()
+
 
-    curr_skew = 0
-    for i in range(len(genome)):
-        n = genome[i]
+def _iter_chunk_skews(genome: np.ndarray, chunk_size: int):
+    """
+    Calculate skew of prefixes of the genome chunk by chunk
+    :return: a generator of (chunk start, skews of prefixes ending in the chunk)
+    """
+    skew = 0
+    for start in range(0, len(genome), chunk_size):
+        skews = np.cumsum(_SKEW_DELTAS[genome[start:start + chunk_size]], dtype=np.int64)
+        skews += skew
+        skew = skews[-1]
+        yield start, skews
 
-        if n == SKEW_INCREASER:
-            curr_skew += 1
-        elif n == SKEW_DECREASER:
-            curr_skew -= 1
 
-        if curr_skew < min_skew:
-            min_skew = curr_skew
-            result.clear()
+def iter_min_skew_positions(genome, chunk_size: int = CHUNK_SIZE):
+    """
+    Find all positions of minimum skew, like 'min_skew_positions()', in two passes over the genome: the first pass
+    finds the minimum skew, the second one produces positions where it is reached. Only skews of one chunk are kept
+    in memory at a time
+    :param genome: string or bytes to examine
+    :param chunk_size: number of bases processed at once
+    :return: a generator of positions, in increasing order
+    """
+    genome = _as_bytes_view(genome)
 
-        if curr_skew == min_skew:
-            result.append(i + 1)
+    min_skew = 0
+    for _, skews in _iter_chunk_skews(genome, chunk_size):
+        min_skew = min(min_skew, int(skews.min()))
 
-    return result
+    if min_skew == 0:
+        yield 0
+    for start, skews in _iter_chunk_skews(genome, chunk_size):
+        yield from (np.flatnonzero(skews == min_skew) + (start + 1)).tolist()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,24 @@
+import random
+import unittest
+
+from l_t_clumps import l_t_clumps, multi_k_l_t_clumps
+
+
+class MultiKLTClumpsTest(unittest.TestCase):
+    def test_fewer_kmers_than_t(self):
+        self.assertEqual(multi_k_l_t_clumps('ACG', [1], 10, 5), {1: []})
+        self.assertEqual(multi_k_l_t_clumps('ACGTA', [1, 2, 3], 5, 4), {1: [], 2: [], 3: []})
+        self.assertEqual(multi_k_l_t_clumps('', [1], 10, 2), {1: []})
+
+    def test_same_as_l_t_clumps(self):
+        rng = random.Random(12)
+        for _ in range(100):
+            genome = ''.join(rng.choice('ACGT') for _ in range(rng.randint(0, 60)))
+            l, t = rng.randint(5, 30), rng.randint(1, 6)
+            result = multi_k_l_t_clumps(genome, range(1, 6), l, t)
+            for k in range(1, 6):
+                self.assertEqual(result[k], sorted(l_t_clumps(genome, k, l, t)), (genome, k, l, t))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import numpy as np
+
 
 def main():
     pattern = input()
@@ -10,31 +12,80 @@ def main():
     print(distance)
 
 
-def _true_hamming_distance(a: str, b: str) -> int:
+# Maximum number of (pattern, window) pairs compared at once by 'hamming_distances()'
+PAIRS_BATCH_MAX = 1 << 22
+
+
+def encode_sequence(sequence) -> np.ndarray:
     """
-    Calculate classic hamming distance
+    Get a uint8 array of characters of the given sequence ('str' or bytes); an array is returned as is
     """
-    distance = 0
-    for i in range(len(a)):
-        if a[i] != b[i]:
-            distance += 1
-    return distance
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii')
+    return np.frombuffer(sequence, dtype=np.uint8)
 
 
-def hamming_distance(pattern: str, genomes: list) -> int:
+def _window_mismatches(patterns: np.ndarray, genome: np.ndarray) -> np.ndarray:
     """
-    Get hamming distance between 'pattern' and 'genomes'
+    Count mismatches of every pattern with every window of the genome: a broadcast compare of each pattern position
+    with the genome shifted by it, summed over positions
+    :param patterns: an array of shape (number of patterns, k)
+    :return: an array of shape (number of patterns, len(genome) - k + 1)
     """
-    distance = 0
+    k = patterns.shape[1]
+    windows = len(genome) - k + 1
+    result = np.zeros((len(patterns), windows), dtype=np.int32)
+    for j in range(k):
+        result += genome[np.newaxis, j:j + windows] != patterns[:, j, np.newaxis]
+    return result
+
+
+def hamming_distances(patterns: list, genomes: list, bound: int = None) -> np.ndarray:
+    """
+    Get hamming distances between each of 'patterns' (of the same length) and 'genomes', comparing all windows of a
+    genome with a batch of patterns at once
+    :param patterns: a list of patterns ('str', bytes or uint8 arrays)
+    :param genomes: a list of genomes ('str', bytes or uint8 arrays), each one at least as long as the patterns
+    :param bound: if given, a pattern is not compared with the rest of the genomes as soon as its partial distance
+    exceeds 'bound'; its result is then the partial distance (which is greater than 'bound', but may be lower than
+    the distance)
+    :return: an int64 array of distances, one per pattern
+    """
+    if len(patterns) == 0:
+        return np.zeros(0, dtype=np.int64)
+    patterns = np.stack([encode_sequence(pattern) for pattern in patterns])
+    k = patterns.shape[1]
+    result = np.zeros(len(patterns), dtype=np.int64)
+    active = np.arange(len(patterns))
+
     for genome in genomes:
-        genome_distance = None
-        for i in range(len(genome) - len(pattern) + 1):
-            subpattern = genome[i:i + len(pattern)]
-            subpattern_distance = _true_hamming_distance(subpattern, pattern)
-            if genome_distance is None or subpattern_distance < genome_distance:
-                genome_distance = subpattern_distance
-        distance += genome_distance
-    return distance
+        genome = encode_sequence(genome)
+        windows = len(genome) - k + 1
+        if windows <= 0:
+            raise ValueError('A genome of length {} is shorter than the patterns ({})'.format(len(genome), k))
+
+        batch_size = max(PAIRS_BATCH_MAX // windows, 1)
+        for batch_start in range(0, len(active), batch_size):
+            batch = active[batch_start:batch_start + batch_size]
+            result[batch] += _window_mismatches(patterns[batch], genome).min(axis=1)
+
+        if bound is not None:
+            active = active[result[active] <= bound]
+            if len(active) == 0:
+                break
+
+    return result
+
+
+def hamming_distance(pattern: str, genomes: list, bound: int = None) -> int:
+    """
+    Get hamming distance between 'pattern' and 'genomes'
+    :param bound: if given, return as soon as the partial distance over the genomes processed so far exceeds 'bound';
+    the result is then greater than 'bound', but may be lower than the distance
+    """
+    return int(hamming_distances([pattern], genomes, bound)[0])
 
 
 if __name__ == '__main__':
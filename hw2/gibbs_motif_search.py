@@ -1,166 +1,162 @@
 #!/usr/bin/env python3
 
-from functools import reduce
-from random import randint, choices
+import argparse
+import sys
+import time
+from random import Random, randint
+
+from motif_restarts import restart_seeds, run_restarts, shared_scorer, vote_motifs
+from profile_scoring import MotifProfile, ProfileScorer
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Find motifs by Gibbs sampling with restarts')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='run chains in this number of processes (0 means the number of CPUs)'
+    )
+    parser.add_argument('--seed', type=int, help='seed of chains run in processes, for reproducible results')
+    parser.add_argument(
+        '--patience', type=int,
+        help='stop a chain when its best score has not improved for this number of iterations'
+    )
+    parser.add_argument('--time-budget', type=float, help='stop all chains after this number of seconds')
+    parser.add_argument('--stats', action='store_true', help='print the number of iterations of every chain to stderr')
+    args = parser.parse_args()
+
     k, total_genomes, n = list(map(int, input().split()))
     genomes = []
     for _ in range(total_genomes):
         genomes.append(input().upper())
 
-    best_motifs = summarized_gibbs_motif_search(k, genomes, n, 20)
+    stats = {}
+    if args.workers is None:
+        best_motifs = summarized_gibbs_motif_search(k, genomes, n, 20, args.patience, args.time_budget, stats)
+    else:
+        best_motifs = parallel_gibbs_motif_search(
+            k, genomes, n, 20, args.workers if args.workers > 0 else None, args.seed, args.patience, args.time_budget,
+            stats
+        )
 
     for motif in best_motifs:
         print(motif)
+    if args.stats:
+        for chain, iterations in enumerate(stats['iterations']):
+            print('Chain {}: {} iterations'.format(chain, iterations), file=sys.stderr)
 
 
-ACTG_MAP = {
-    'A': 0,
-    'C': 1,
-    'T': 2,
-    'G': 3,
-}
-
-ACTG_REVERSE_MAP = {
-    0: 'A',
-    1: 'C',
-    2: 'T',
-    3: 'G'
-}
-
-
-def _recount_profile(profile: list, genome: str) -> None:
-    """
-    Include 'genome' into given 'profile' counts matrix
-    """
-    for i in range(len(genome)):
-        profile[i][ACTG_MAP[genome[i]]] += 1
-
-
-def _profile(genomes: list) -> list:
-    """
-    Generate a profile (counts) of the given 'genomes'
-    """
-    result = [[1 for _ in range(4)] for _ in range(len(genomes[0]))]
-    for genome in genomes:
-        _recount_profile(result, genome)
-    return result
-
-
-def _profile_to_probs(profile: list, total_genomes: int) -> list:
-    """
-    Convert a profile (with counts) to a profile of probabilities
-    """
-    result = []
-    for bases in profile:
-        result.append([float(bases[i]) / (float(total_genomes) + 4.) for i in range(4)])
-    return result
-
-
-def _mer_probability(profile_probs: list, genome: str) -> float:
-    """
-    Return probability of the given 'genome' in the given 'profile_probs'
-    """
-    return reduce(
-        lambda x, y: x * y,
-        [profile_probs[i][ACTG_MAP[genome[i]]] for i in range(len(genome))]
-    )
-
-
-def _profile_consensus_mer(profile: list) -> str:
-    """
-    Get a consensus mer from the given profile
-    """
-    result = []
-    for bases in profile:
-        min_base = max(range(len(bases)), key=bases.__getitem__)
-        result.append(ACTG_REVERSE_MAP[min_base])
-    return ''.join(result)
-
-
-def _score_mers(mers: list, consensus: str) -> int:
-    """
-    Calculate the score of a mer list
-    """
-    result = 0
-    for mer in mers:
-        for i in range(len(mer)):
-            if mer[i] != consensus[i]:
-                result += 1
-    return result
-
-
-def _random_probable_motif(profile_probs: list, k: int, genome: str):
-    """
-    Return a random most-probable by the given profile motif from the given genome
-    """
-    mers = []
-    probabilities = []
-
-    for k_start in range(len(genome) - k + 1):
-        mers.append(genome[k_start:k_start + k])
-        probabilities.append(reduce(
-            lambda x, y: x * y,
-            [profile_probs[i][ACTG_MAP[mers[-1][i]]] for i in range(len(mers[-1]))]
-        ))
-
-    return choices(mers, probabilities)[0]
-
-
-def gibbs_motif_search(k: int, genomes: list, n: int) -> list:
+def gibbs_motif_search(k: int, genomes: list, n: int, rng: Random = None, scorer: ProfileScorer = None,
+                       patience: int = None, deadline: float = None, stats: dict = None) -> list:
     """
     Find profile-best motifs of length 'k' in each of the 'genomes' using a randomized algorithm
-    """
+    :param n: maximum number of iterations
+    :param rng: random generator to use; the global one of 'random' module if not given
+    :param scorer: a scorer of 'genomes', if one is already built
+    :param patience: if given, stop when the best score has not improved for this number of iterations
+    :param deadline: if given, stop when 'time.time()' reaches it
+    :param stats: if given, its 'iterations' entry is set to the number of iterations done
+    """
+    if scorer is None:
+        scorer = ProfileScorer(genomes)
+    random_int = randint if rng is None else rng.randint
     best_motifs = []
     for genome in genomes:
-        r = randint(0, len(genomes[0]) - k)
+        r = random_int(0, len(genomes[0]) - k)
         best_motifs.append(genome[r:r + k])
-    best_motifs_score = _score_mers(best_motifs, _profile_consensus_mer(_profile_to_probs(_profile(best_motifs), len(best_motifs))))
-
-    for j in range(n):
-        i_rotate = randint(0, len(genomes) - 1)
-
-        rotated_best_motifs = best_motifs[0:i_rotate]
-        rotated_best_motifs.extend(best_motifs[i_rotate + 1:len(best_motifs)])
-
-        profile_probs = _profile_to_probs(_profile(rotated_best_motifs), len(rotated_best_motifs))
-        probable_motif = _random_probable_motif(profile_probs, k, genomes[i_rotate])
-
-        rotated_best_motifs.insert(i_rotate, probable_motif)
-        rotated_score = _score_mers(rotated_best_motifs, _profile_consensus_mer(_profile_to_probs(_profile(rotated_best_motifs), len(rotated_best_motifs))))
+    # The profile is kept equal to the profile of 'best_motifs' between iterations
+    profile = MotifProfile.from_motifs(best_motifs)
+    best_motifs_score = profile.score
+
+    iterations = 0
+    iterations_without_improvement = 0
+    while iterations < n:
+        if patience is not None and iterations_without_improvement >= patience:
+            break
+        if deadline is not None and time.time() >= deadline:
+            break
+        iterations += 1
+
+        i_rotate = random_int(0, len(genomes) - 1)
+
+        profile.remove(best_motifs[i_rotate])
+        probable_motif = scorer.random_probable_mer(profile.log_profile(1), i_rotate, rng)
+
+        profile.add(probable_motif)
+        rotated_score = profile.score
         if rotated_score < best_motifs_score:
-            best_motifs = rotated_best_motifs
+            best_motifs = best_motifs[:]
+            best_motifs[i_rotate] = probable_motif
             best_motifs_score = rotated_score
-
+            iterations_without_improvement = 0
+        else:
+            profile.remove(probable_motif)
+            profile.add(best_motifs[i_rotate])
+            iterations_without_improvement += 1
+
+    if stats is not None:
+        stats['iterations'] = iterations
     return best_motifs
 
 
-def summarized_gibbs_motif_search(k: int, genomes: list, n: int, samples: int) -> list:
+def summarized_gibbs_motif_search(k: int, genomes: list, n: int, samples: int, patience: int = None,
+                                  time_budget: float = None, stats: dict = None) -> list:
     """
     Perform 'gibbs_motif_search()' 'samples' times
+    :param patience: see 'gibbs_motif_search()'
+    :param time_budget: if given, all chains stop after this number of seconds in total
+    :param stats: if given, its 'iterations' entry is set to a list of numbers of iterations done by every chain
     """
+    deadline = time.time() + time_budget if time_budget is not None else None
+    scorer = ProfileScorer(genomes)
     randomized_search_results = []
+    iterations = []
     for _ in range(samples):
-        randomized_search_results.append(gibbs_motif_search(k, genomes, n))
+        chain_stats = {}
+        randomized_search_results.append(
+            gibbs_motif_search(k, genomes, n, None, scorer, patience, deadline, chain_stats)
+        )
+        iterations.append(chain_stats['iterations'])
+
+    if stats is not None:
+        stats['iterations'] = iterations
+    return vote_motifs(randomized_search_results, len(genomes))
+
 
+def _gibbs_chains(task: tuple) -> list:
+    """
+    Run 'gibbs_motif_search()' over the shared genomes once per seed of a task ((k, n, patience, deadline), seeds)
+    :return: a list of (motifs, number of iterations)
+    """
+    (k, n, patience, deadline), seeds = task
+    scorer = shared_scorer()
     result = []
-    for i in range(len(genomes)):
-        randomized_search_counts = {}
-        randomized_search_max_count = 0
-        randomized_search_max_motif = None
+    for seed in seeds:
+        chain_stats = {}
+        motifs = gibbs_motif_search(k, scorer.genomes, n, Random(seed), scorer, patience, deadline, chain_stats)
+        result.append((motifs, chain_stats['iterations']))
+    return result
 
-        for search_result in randomized_search_results:
-            count = randomized_search_counts.get(search_result[i], 0) + 1
-            if count > randomized_search_max_count:
-                randomized_search_max_count = count
-                randomized_search_max_motif = search_result[i]
-            randomized_search_counts[search_result[i]] = count
 
-        result.append(randomized_search_max_motif)
+def parallel_gibbs_motif_search(k: int, genomes: list, n: int, samples: int, workers: int = None, seed: int = None,
+                                patience: int = None, time_budget: float = None, stats: dict = None) -> list:
+    """
+    Perform 'gibbs_motif_search()' 'samples' times in a pool of processes, and choose motifs by votes as
+    'summarized_gibbs_motif_search()' does. Every chain has its own random generator derived from 'seed', so without
+    a time budget the result only depends on the seed
+    :param workers: number of processes; the number of CPUs by default
+    :param seed: an integer seed; fresh entropy if None
+    :param patience: see 'gibbs_motif_search()'
+    :param time_budget: if given, all chains stop after this number of seconds in total
+    :param stats: if given, its 'iterations' entry is set to a list of numbers of iterations done by every chain
+    """
+    deadline = time.time() + time_budget if time_budget is not None else None
+    results = run_restarts(
+        ProfileScorer(genomes), _gibbs_chains, restart_seeds(seed, samples), (k, n, patience, deadline), workers
+    )
 
-    return result
+    if stats is not None:
+        stats['iterations'] = [iterations for _, iterations in results]
+    return vote_motifs([motifs for motifs, _ in results], len(genomes))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+"""
+Greedy motif search, seeded by every k-mer of the first string, with seeds evaluated in a pool of processes.
+
+Seeds are independent: a seed k-mer is extended into a motif list one string at a time, taking a most probable k-mer
+of the next string under the profile of the motifs chosen so far. Consecutive ranges of seeds are evaluated by
+'motif_restarts.run_restarts()', so strings are encoded once per worker. With a beam width B > 1, every seed keeps the
+B best partial motif lists (by score) instead of one, each extended by its B most probable k-mers of the next string
+"""
+
+from motif_restarts import run_restarts, shared_scorer
+from profile_scoring import MotifProfile, ProfileScorer
+
+
+def greedy_seed_motifs(scorer: ProfileScorer, k: int, start: int, pseudocount: int = 0, beam_width: int = 1) -> tuple:
+    """
+    Extend the k-mer of the first string at 'start' into motifs of all strings of 'scorer'
+    :param pseudocount: added to every count of profiles which choose k-mers
+    :param beam_width: number of partial motif lists kept at every string
+    :return: the score and the list of motifs; of lists with the same score, the first one found
+    """
+    seed = scorer.genomes[0][start:start + k]
+    beam = [(MotifProfile.from_motifs([seed]), [seed])]
+    for row in range(1, len(scorer.genomes)):
+        candidates = []
+        seen = set()
+        for profile, motifs in beam:
+            for mer in scorer.top_probable_mers(profile.log_profile(pseudocount), row, beam_width):
+                extended_motifs = motifs + [mer]
+                if tuple(extended_motifs) in seen:
+                    continue
+                seen.add(tuple(extended_motifs))
+                extended_profile = profile.copy()
+                extended_profile.add(mer)
+                candidates.append((extended_profile, extended_motifs))
+        # The sort is stable, so candidates with the same score keep the order they were found in
+        candidates.sort(key=lambda candidate: candidate[0].score)
+        beam = candidates[:beam_width]
+
+    profile, motifs = beam[0]
+    return profile.score, motifs
+
+
+def _greedy_seeds(task: tuple) -> list:
+    """
+    Run 'greedy_seed_motifs()' over the shared strings once per start of a task ((k, pseudocount, beam_width), starts)
+    :return: a list of (score, motifs)
+    """
+    (k, pseudocount, beam_width), starts = task
+    scorer = shared_scorer()
+    return [greedy_seed_motifs(scorer, k, start, pseudocount, beam_width) for start in starts]
+
+
+def seeded_greedy_motif_search(k: int, genomes: list, pseudocount: int = 0, workers: int = None,
+                               beam_width: int = 1) -> list:
+    """
+    Find profile-best motifs of length 'k' in each of the 'genomes', trying every k-mer of the first string as a seed.
+    Of seeds with the same score, the first one wins; if no seed beats the first k-mers of the strings, they are the
+    result
+    :param pseudocount: added to every count of profiles which choose k-mers
+    :param workers: number of processes; the number of CPUs by default. With 1, seeds are evaluated in this process
+    :param beam_width: number of partial motif lists kept for every seed
+    """
+    best_motifs = [genome[:k] for genome in genomes]
+    best_motifs_score = MotifProfile.from_motifs(best_motifs).score
+
+    results = run_restarts(
+        ProfileScorer(genomes), _greedy_seeds, list(range(len(genomes[0]) - k + 1)), (k, pseudocount, beam_width),
+        workers
+    )
+    for motifs_score, motifs in results:
+        if motifs_score < best_motifs_score:
+            best_motifs = motifs
+            best_motifs_score = motifs_score
+
+    return best_motifs
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+from multiprocessing import Pool, Value
+
+import numpy as np
+
+from distance import encode_sequence, hamming_distances
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find a median string of DNA strings')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='search subtrees of the pattern trie in this number of processes (0 means the number of CPUs)'
+    )
+    parser.add_argument(
+        '--stats', action='store_true', help='print the distance and the number of visited trie nodes to stderr'
+    )
+    args = parser.parse_args()
+
+    k = int(input())
+    genomes = []
+    while True:
+        try:
+            line = input().strip()
+        except EOFError:
+            break
+        if len(line) > 0:
+            genomes.append(line.upper())
+
+    stats = {}
+    workers = args.workers if args.workers is None or args.workers > 0 else os.cpu_count()
+    print(median_string(k, genomes, workers if workers is not None else 1, stats))
+    if args.stats:
+        print('Distance {}, visited {} trie nodes'.format(stats['distance'], stats['nodes']), file=sys.stderr)
+
+
+ALPHABET = 'ACGT'
+
+# Number of subtrees of the pattern trie per worker process, to balance the load
+SUBTREES_PER_WORKER = 4
+
+
+def _mismatch_tables(k: int, genomes: list) -> tuple:
+    """
+    Precompute mismatches of every base at every pattern position with every window of every genome
+    :return: a uint8 array of shape (4, k, t, windows), and initial mismatch counts of shape (t, windows): 0 for
+    windows which fit into their genome, k + 1 (more than any pattern can have) for windows past the end of a genome
+    """
+    lengths = [len(genome) for genome in genomes]
+    windows = max(lengths) - k + 1
+    codes = np.zeros((len(genomes), max(lengths)), dtype=np.uint8)
+    # Counts never exceed 2 * k + 1, and narrow ones are faster to add and reduce
+    initial = np.zeros((len(genomes), windows), dtype=np.uint8 if 2 * k + 1 <= 0xFF else np.int32)
+    for i, genome in enumerate(genomes):
+        codes[i, :len(genome)] = encode_sequence(genome)
+        initial[i, len(genome) - k + 1:] = k + 1
+
+    tables = np.zeros((len(ALPHABET), k, len(genomes), windows), dtype=np.uint8)
+    for base_index, base in enumerate(ALPHABET.encode('ascii')):
+        for j in range(k):
+            tables[base_index, j] = codes[:, j:j + windows] != base
+    return tables, initial
+
+
+def _search_subtree(tables: np.ndarray, initial: np.ndarray, prefix: tuple, best_distance: int,
+                    shared_best_distance=None) -> tuple:
+    """
+    Find the first (lexicographically) pattern with the minimum distance lower than 'best_distance' under the given
+    prefix, walking the pattern trie depth-first.
+
+    Every node keeps mismatch counts of its prefix with every window of every genome; the sum over genomes of the
+    minimum count is a lower bound of the distance of every pattern under the node, so the node is pruned as soon as
+    the bound is not lower than the best distance found
+    :param prefix: a tuple of base indexes
+    :param shared_best_distance: if given, the best distance found in other subtrees (a 'multiprocessing.Value');
+    nodes whose bound exceeds it are pruned, and it is updated when a better pattern is found
+    :return: the distance, the pattern (None if there is no pattern with distance lower than 'best_distance') and the
+    number of visited nodes
+    """
+    k = tables.shape[1]
+    mismatches = initial
+    for depth, base_index in enumerate(prefix):
+        mismatches = mismatches + tables[base_index, depth]
+
+    best_pattern = None
+    nodes = 0
+    # Stack of (prefix, mismatch counts, bound)
+    stack = [(prefix, mismatches, int(mismatches.min(axis=1).sum()))]
+    while len(stack) > 0:
+        prefix, mismatches, bound = stack.pop()
+        if bound >= best_distance:
+            continue
+        # Another subtree may only prune patterns which are worse than its best one: on ties, the first pattern wins
+        if shared_best_distance is not None and bound > shared_best_distance.value:
+            continue
+        nodes += 1
+
+        depth = len(prefix)
+        if depth == k:
+            best_distance = bound
+            best_pattern = prefix
+            if shared_best_distance is not None:
+                with shared_best_distance.get_lock():
+                    shared_best_distance.value = min(shared_best_distance.value, bound)
+            continue
+
+        children = mismatches[np.newaxis] + tables[:, depth]
+        bounds = children.min(axis=2).sum(axis=1).tolist()
+        # Children are popped in alphabetical order
+        for base_index in reversed(range(len(ALPHABET))):
+            if bounds[base_index] < best_distance:
+                stack.append((prefix + (base_index,), children[base_index], bounds[base_index]))
+
+    if best_pattern is not None:
+        best_pattern = ''.join(ALPHABET[base_index] for base_index in best_pattern)
+    return best_distance, best_pattern, nodes
+
+
+# Mismatch tables and the best distance shared with worker processes of 'median_string()'
+_worker_tables = None
+_worker_initial = None
+_worker_best_distance = None
+
+
+def _init_worker(tables: np.ndarray, initial: np.ndarray, best_distance) -> None:
+    """
+    Initialize a worker process of 'median_string()'
+    """
+    global _worker_tables, _worker_initial, _worker_best_distance
+    _worker_tables = tables
+    _worker_initial = initial
+    _worker_best_distance = best_distance
+
+
+def _search_worker_subtree(task: tuple) -> tuple:
+    prefix, best_distance = task
+    return _search_subtree(_worker_tables, _worker_initial, prefix, best_distance, _worker_best_distance)
+
+
+def median_string(k: int, genomes: list, workers: int = 1, stats: dict = None) -> str:
+    """
+    Find a pattern of length 'k' with the minimum hamming distance to 'genomes' (see 'distance.hamming_distance()');
+    of several such patterns, the first one in alphabetical order.
+
+    The search is a branch and bound over the pattern trie. The best distance of k-mers of the first genome is an
+    initial upper bound. Subtrees of the top trie levels are searched in a pool of processes, which share the best
+    distance found so far
+    :param workers: number of processes; with 1, the search runs in this process
+    :param stats: if given, its 'distance' entry is set to the distance of the pattern, and 'nodes' to the number of
+    visited trie nodes
+    :return: the pattern
+    """
+    if any(len(genome) < k for genome in genomes):
+        raise ValueError('Every genome must be at least {} characters long'.format(k))
+    tables, initial = _mismatch_tables(k, genomes)
+
+    first_kmers = [genomes[0][i:i + k] for i in range(len(genomes[0]) - k + 1)]
+    # Patterns with the same distance as the best k-mer may precede it alphabetically, so they are not pruned
+    initial_best_distance = int(hamming_distances(first_kmers, genomes).min()) + 1
+
+    if workers is None or workers <= 1:
+        distance, pattern, nodes = _search_subtree(tables, initial, (), initial_best_distance)
+    else:
+        split_depth = 0
+        while split_depth < k and len(ALPHABET) ** split_depth < workers * SUBTREES_PER_WORKER:
+            split_depth += 1
+        prefixes = [()]
+        for _ in range(split_depth):
+            prefixes = [prefix + (base_index,) for prefix in prefixes for base_index in range(len(ALPHABET))]
+
+        shared_best_distance = Value('q', initial_best_distance)
+        with Pool(workers, initializer=_init_worker, initargs=(tables, initial, shared_best_distance)) as pool:
+            results = pool.map(
+                _search_worker_subtree, [(prefix, initial_best_distance) for prefix in prefixes], chunksize=1
+            )
+
+        distance, pattern, nodes = initial_best_distance, None, 0
+        for subtree_distance, subtree_pattern, subtree_nodes in results:
+            nodes += subtree_nodes
+            if subtree_pattern is not None and subtree_distance < distance:
+                distance, pattern = subtree_distance, subtree_pattern
+
+    if stats is not None:
+        stats['distance'] = distance
+        stats['nodes'] = nodes
+    return pattern
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Running independent restarts of a randomized motif search in a pool of processes.
+
+The encoded strings are placed into shared memory once; every worker builds its 'ProfileScorer' over them. Every
+restart gets its own random generator, seeded from a 'numpy.random.SeedSequence', so results depend on the seed only,
+not on the number of workers or on how restarts are distributed among them
+"""
+
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from profile_scoring import ProfileScorer
+
+
+# Number of batches of restarts per worker, to balance the load
+BATCHES_PER_WORKER = 4
+
+# Scorer of the strings shared with worker processes of 'run_restarts()', and the shared memory it is built on
+_shared_scorer = None
+_shared_codes = None
+
+
+def restart_seeds(seed, n: int) -> list:
+    """
+    Generate independent seeds for 'n' restarts
+    :param seed: an integer seed; fresh entropy if None
+    :return: a list of seeds for 'random.Random()'
+    """
+    return [child.generate_state(4).tobytes() for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+def _attach_shared_codes(name: str, shape: tuple, lengths: list) -> None:
+    """
+    Initialize a worker process of 'run_restarts()'
+    """
+    global _shared_scorer, _shared_codes
+    _shared_codes = SharedMemory(name=name)
+    _shared_scorer = ProfileScorer.from_codes(np.ndarray(shape, dtype=np.uint8, buffer=_shared_codes.buf), lengths)
+
+
+def shared_scorer() -> ProfileScorer:
+    """
+    Get the scorer of the strings 'run_restarts()' was called for. Only valid in functions run by it
+    """
+    return _shared_scorer
+
+
+def run_restarts(scorer: ProfileScorer, function, seeds: list, args: tuple, workers: int = None) -> list:
+    """
+    Run 'function(args, seeds_batch)' for consecutive batches of seeds in a pool of processes. The function gets the
+    strings through 'shared_scorer()' and returns a list of results, one per seed
+    :param workers: number of processes; the number of CPUs by default. With 1, restarts run in this process
+    :return: a list of results, one per seed, in order of seeds
+    """
+    global _shared_scorer
+    if workers is None:
+        workers = os.cpu_count()
+    batch_size = max(-(-len(seeds) // (workers * BATCHES_PER_WORKER)), 1)
+    tasks = [(args, seeds[start:start + batch_size]) for start in range(0, len(seeds), batch_size)]
+
+    if workers == 1 or len(tasks) <= 1:
+        _shared_scorer = scorer
+        try:
+            batches = [function(task) for task in tasks]
+        finally:
+            _shared_scorer = None
+    else:
+        shared_codes = SharedMemory(create=True, size=max(scorer.codes.nbytes, 1))
+        try:
+            codes = np.ndarray(scorer.codes.shape, dtype=np.uint8, buffer=shared_codes.buf)
+            codes[:] = scorer.codes
+            del codes
+            with Pool(
+                min(workers, len(tasks)), initializer=_attach_shared_codes,
+                initargs=(shared_codes.name, scorer.codes.shape, scorer.lengths)
+            ) as pool:
+                batches = pool.map(function, tasks)
+        finally:
+            shared_codes.close()
+            shared_codes.unlink()
+
+    return [result for batch in batches for result in batch]
+
+
+def vote_motifs(results: list, total_genomes: int, max_counts: list = None) -> list:
+    """
+    Choose the most frequent motif of every string among results of restarts. Of motifs with the same count, the one
+    which reached it first (in order of results) wins
+    :param results: a list of motif lists, one per restart
+    :param max_counts: if given, filled with the number of votes for the chosen motif of every string
+    :return: a list of motifs, one per string
+    """
+    result = []
+    for i in range(total_genomes):
+        search_counts = {}
+        search_max_count = 0
+        search_max_motif = None
+
+        for search_result in results:
+            count = search_counts.get(search_result[i], 0) + 1
+            if count > search_max_count:
+                search_max_count = count
+                search_max_motif = search_result[i]
+            search_counts[search_result[i]] = count
+
+        result.append(search_max_motif)
+        if max_counts is not None:
+            max_counts.append(search_max_count)
+
+    return result
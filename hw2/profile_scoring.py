@@ -0,0 +1,237 @@
+"""
+Scoring all k-mers of DNA strings against a profile at once, with NumPy.
+
+Profiles are kept in log space ('LogProfile'): the probability of a k-mer is the sum of log-probabilities of its bases,
+which neither underflows for long k-mers nor needs chains of multiplications. Strings are encoded once into a (t, n)
+matrix of base codes in the order of profile columns ('A' = 0, 'C' = 1, 'T' = 2, 'G' = 3). The log-probability of every
+window of every string is then a sum of k gathers, one per profile position, from the row of the log table by the
+code matrix shifted by the position
+"""
+
+from random import Random, choices
+
+import numpy as np
+
+
+ACTG = 'ACTG'
+
+# Code of positions past the end of a string shorter than the longest one. Its probability is 0
+PAD_CODE = 4
+
+_INVALID_CODE = 0xFF
+_ENCODE_TABLE = bytes(ACTG.index(chr(c)) if chr(c) in ACTG else _INVALID_CODE for c in range(256))
+_DECODE_TABLE = bytes(ord(ACTG[c]) if c < len(ACTG) else _INVALID_CODE for c in range(256))
+
+# Windows whose log-probabilities differ by less than this are equally probable; the first one of them is the most
+# probable (as with exact comparison of probabilities)
+TIE_TOLERANCE = 1e-9
+
+
+def encode_genomes(genomes: list) -> np.ndarray:
+    """
+    Encode DNA strings into a matrix of base codes, one row per string; shorter strings are padded with PAD_CODE
+    :raises ValueError: if a string contains a character other than 'A', 'C', 'G', 'T'
+    """
+    result = np.full((len(genomes), max((len(genome) for genome in genomes), default=0)), PAD_CODE, dtype=np.uint8)
+    for i, genome in enumerate(genomes):
+        codes = genome.encode('ascii').translate(_ENCODE_TABLE)
+        invalid_at = codes.find(_INVALID_CODE)
+        if invalid_at != -1:
+            raise ValueError("Cannot encode character '{}' at position {}".format(genome[invalid_at], invalid_at))
+        result[i, :len(codes)] = np.frombuffer(codes, dtype=np.uint8)
+    return result
+
+
+def decode_genomes(codes: np.ndarray, lengths: list) -> list:
+    """
+    Decode rows of a matrix produced by 'encode_genomes()' back into strings of the given lengths
+    """
+    return [row[:length].tobytes().translate(_DECODE_TABLE).decode('ascii') for row, length in zip(codes, lengths)]
+
+
+class LogProfile:
+    """
+    A profile of log-probabilities: a (k, 5) table, whose columns are 'A', 'C', 'T', 'G' and PAD_CODE (always -inf).
+    Create it with 'LogProfile.from_counts()' or 'LogProfile.from_probs()'
+    """
+    def __init__(self, table: np.ndarray):
+        self.table = table
+        self.k = len(table)
+
+    @staticmethod
+    def from_probs(profile_probs) -> 'LogProfile':
+        """
+        Convert a profile of probabilities (k rows of 4 probabilities, in ACTG order)
+        """
+        table = np.full((len(profile_probs), PAD_CODE + 1), -np.inf)
+        with np.errstate(divide='ignore'):
+            table[:, :PAD_CODE] = np.log(np.asarray(profile_probs, dtype=np.float64))
+        return LogProfile(table)
+
+    @staticmethod
+    def from_counts(profile, total: float) -> 'LogProfile':
+        """
+        Convert a profile of counts (k rows of 4 counts, in ACTG order), whose probabilities are counts divided by
+        'total'
+        """
+        return LogProfile.from_probs(np.asarray(profile, dtype=np.float64) / total)
+
+
+class MotifProfile:
+    """
+    Counts of bases at every position of a list of motifs of length k, kept current as motifs are added and removed
+    one by one in O(k). The score (the number of mismatches of the motifs with their consensus) is kept current too:
+    it is the sum of 'total - max count' over positions
+    """
+    def __init__(self, k: int):
+        self.k = k
+        self.total = 0
+        self.counts = [[0, 0, 0, 0] for _ in range(k)]
+        self._max_counts = [0] * k
+        self._max_counts_sum = 0
+
+    @staticmethod
+    def from_motifs(motifs: list, k: int = None) -> 'MotifProfile':
+        """
+        Create a profile of the given motifs; 'k' is only needed if there are no motifs
+        """
+        result = MotifProfile(len(motifs[0]) if k is None else k)
+        for motif in motifs:
+            result.add(motif)
+        return result
+
+    def _update(self, motif: str, delta: int) -> None:
+        counts = self.counts
+        max_counts = self._max_counts
+        max_counts_sum = self._max_counts_sum
+        for i, c in enumerate(motif.encode('ascii').translate(_ENCODE_TABLE)):
+            position_counts = counts[i]
+            position_counts[c] += delta
+            max_count = max(position_counts)
+            max_counts_sum += max_count - max_counts[i]
+            max_counts[i] = max_count
+        self._max_counts_sum = max_counts_sum
+        self.total += delta
+
+    def add(self, motif: str) -> None:
+        self._update(motif, 1)
+
+    def remove(self, motif: str) -> None:
+        """
+        Remove a motif which was added earlier
+        """
+        self._update(motif, -1)
+
+    def copy(self) -> 'MotifProfile':
+        result = MotifProfile(self.k)
+        result.total = self.total
+        result.counts = [position_counts[:] for position_counts in self.counts]
+        result._max_counts = self._max_counts[:]
+        result._max_counts_sum = self._max_counts_sum
+        return result
+
+    @property
+    def score(self) -> int:
+        return self.total * self.k - self._max_counts_sum
+
+    def consensus(self) -> str:
+        """
+        Get the consensus motif: the most frequent base at every position (the first one in ACTG order on ties)
+        """
+        return ''.join(ACTG[position_counts.index(max(position_counts))] for position_counts in self.counts)
+
+    def log_profile(self, pseudocount: int = 0) -> LogProfile:
+        """
+        Get the log-probability profile of the motifs, adding 'pseudocount' to every count
+        """
+        return LogProfile.from_counts(
+            np.asarray(self.counts, dtype=np.float64) + pseudocount, self.total + 4 * pseudocount
+        )
+
+
+class ProfileScorer:
+    """
+    Encoded DNA strings, whose k-mers can be scored against any profile of probabilities
+    """
+    def __init__(self, genomes: list, codes: np.ndarray = None):
+        self.genomes = genomes
+        self.codes = encode_genomes(genomes) if codes is None else codes
+        self.lengths = [len(genome) for genome in genomes]
+
+    @staticmethod
+    def from_codes(codes: np.ndarray, lengths: list) -> 'ProfileScorer':
+        """
+        Create a scorer of strings already encoded by 'encode_genomes()', without copying the codes
+        """
+        return ProfileScorer(decode_genomes(codes, lengths), codes)
+
+    def log_probabilities(self, log_profile: LogProfile, rows=None) -> np.ndarray:
+        """
+        Calculate log-probabilities of all windows of the given strings: for every position of the profile, a gather
+        from its log table by the codes of the strings shifted by the position, added to the sums
+        :param rows: indexes of strings to score; all strings if not given
+        :return: an array of shape (number of strings, n - k + 1); windows which do not fit into a string are -inf
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        windows = max(codes.shape[1] - log_profile.k + 1, 0)
+        result = np.zeros((len(codes), windows))
+        for j in range(log_profile.k):
+            result += log_profile.table[j][codes[:, j:j + windows]]
+        return result
+
+    def _mer(self, row: int, start: int, k: int) -> str:
+        return self.genomes[row][start:start + k]
+
+    def most_probable_mers(self, log_profile: LogProfile, rows=None) -> list:
+        """
+        Find a profile most-probable k-mer in each of the given strings (the first one if there are several)
+        :param rows: indexes of strings; all strings if not given
+        :return: a list of k-mers
+        """
+        if rows is None:
+            rows = range(len(self.genomes))
+        scores = self.log_probabilities(log_profile, rows)
+        if scores.shape[1] == 0:
+            return [None for _ in rows]
+        best = scores.max(axis=1, keepdims=True)
+        starts = np.argmax(scores >= best - TIE_TOLERANCE, axis=1)
+        return [self._mer(row, int(start), log_profile.k) for row, start in zip(rows, starts)]
+
+    def top_probable_mers(self, log_profile: LogProfile, row: int, count: int) -> list:
+        """
+        Find up to 'count' most probable k-mers (by position, so equal k-mers may repeat) of the string with index
+        'row', in order of decreasing probability. The first one is what 'most_probable_mers()' finds for the string;
+        equally probable k-mers go in order of their positions
+        """
+        scores = self.log_probabilities(log_profile, [row])[0, :self.lengths[row] - log_profile.k + 1]
+        available = np.ones(len(scores), dtype=bool)
+        result = []
+        for _ in range(min(count, len(scores))):
+            best = scores[available].max()
+            start = int(np.argmax(available & (scores >= best - TIE_TOLERANCE)))
+            available[start] = False
+            result.append(self._mer(row, start, log_profile.k))
+        return result
+
+    def sampling_weights(self, log_profile: LogProfile, row: int) -> np.ndarray:
+        """
+        Get probabilities of all k-mers of the string with index 'row' (in order of their positions), normalised to sum
+        to 1. Normalisation is done in log space (log-sum-exp), so the weights are exact even if every k-mer
+        probability underflows
+        :raises ValueError: if no k-mer has a non-zero probability
+        """
+        scores = self.log_probabilities(log_profile, [row])[0, :self.lengths[row] - log_profile.k + 1]
+        best = scores.max(initial=-np.inf)
+        if best == -np.inf:
+            raise ValueError('No k-mer of string {} has a non-zero probability'.format(row))
+        weights = np.exp(scores - best)
+        return weights / weights.sum()
+
+    def random_probable_mer(self, log_profile: LogProfile, row: int, rng: Random = None) -> str:
+        """
+        Choose a random k-mer of the string with index 'row', with chances proportional to its profile probability
+        :param rng: random generator to use; the global one of 'random' module if not given
+        """
+        weights = self.sampling_weights(log_profile, row)
+        random_choices = choices if rng is None else rng.choices
+        return self._mer(row, random_choices(range(len(weights)), weights.tolist())[0], log_profile.k)
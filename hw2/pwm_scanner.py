@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+
+import numpy as np
+
+from profile_scoring import ACTG, PAD_CODE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan both strands of a genome for windows which match a profile')
+    parser.add_argument(
+        'profile', help='a file with a profile of probabilities: a line of 4 probabilities (in ACTG order) per position'
+    )
+    parser.add_argument(
+        'genome',
+        help='a file with the genome: a raw sequence or FASTA; hits in FASTA records are prefixed with the record name'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.0, help='report windows whose log-odds score (in bits) is at least this'
+    )
+    parser.add_argument(
+        '--background', type=float, nargs=4, metavar=('A', 'C', 'T', 'G'),
+        help='background probabilities of bases; uniform by default'
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=SCAN_CHUNK_SIZE, help='number of bytes of the genome file scanned at once'
+    )
+    args = parser.parse_args()
+
+    with open(args.profile) as f:
+        profile_probs = [list(map(float, line.split())) for line in f if len(line.strip()) > 0]
+
+    log_odds = log_odds_matrix(profile_probs, args.background)
+    for name, hits in iter_file_pwm_hits(args.genome, log_odds, args.threshold, args.chunk_size):
+        record = () if name is None else (name,)
+        for position, strand, score in hits:
+            print(*record, position, strand, '{:.3f}'.format(score))
+
+
+# Default number of bytes of a genome file scanned at once
+SCAN_CHUNK_SIZE = 1 << 20
+
+# Windows are dropped when their bound is below the threshold by more than this, so rounding errors of the bound do
+# not drop windows which score exactly the threshold
+BOUND_TOLERANCE = 1e-9
+
+# Characters other than 'A', 'C', 'G', 'T' (in any case) are encoded as PAD_CODE, whose score is -inf
+_SCAN_ENCODE_TABLE = bytes(ACTG.index(chr(c).upper()) if chr(c).upper() in ACTG else PAD_CODE for c in range(256))
+_WHITESPACE = b' \t\r\n'
+
+# Code of the complement of every code
+_COMPLEMENT = [ACTG.index(base) for base in 'TGAC'] + [PAD_CODE]
+
+
+def log_odds_matrix(profile_probs, background=None) -> np.ndarray:
+    """
+    Convert a profile of probabilities (k rows of 4 probabilities, in ACTG order) into log-odds scores against the
+    background, in bits
+    :param background: probabilities of 'A', 'C', 'T', 'G'; uniform if not given
+    :return: a (k, 5) table, whose columns are 'A', 'C', 'T', 'G' and PAD_CODE (always -inf); a base with probability 0
+    scores -inf
+    """
+    background = np.full(4, 0.25) if background is None else np.asarray(background, dtype=np.float64)
+    if np.any(background <= 0):
+        raise ValueError('Background probabilities must be positive')
+
+    table = np.full((len(profile_probs), PAD_CODE + 1), -np.inf)
+    with np.errstate(divide='ignore'):
+        table[:, :PAD_CODE] = np.log2(np.asarray(profile_probs, dtype=np.float64) / background)
+    return table
+
+
+def reverse_complement_matrix(log_odds: np.ndarray) -> np.ndarray:
+    """
+    Get the log-odds table which scores a window of the forward strand as 'log_odds' scores its reverse complement
+    """
+    return log_odds[::-1][:, _COMPLEMENT]
+
+
+def _suffix_bounds(log_odds: np.ndarray) -> np.ndarray:
+    """
+    Get maximum scores of suffixes of windows: the j-th element is the maximum score of positions j..k-1
+    :return: an array of k + 1 elements; the last one is 0
+    """
+    result = np.zeros(len(log_odds) + 1)
+    result[:-1] = np.cumsum(log_odds.max(axis=1)[::-1])[::-1]
+    return result
+
+
+def _scan_strand(codes: np.ndarray, log_odds: np.ndarray, suffix_bounds: np.ndarray, threshold: float) -> tuple:
+    """
+    Score all windows of encoded sequence position by position. After every position, windows whose score so far plus
+    the maximum score of the rest of the window is below 'threshold' are dropped
+    :return: starts of the windows which score at least 'threshold', and their scores
+    """
+    starts = np.arange(len(codes) - len(log_odds) + 1)
+    scores = np.zeros(len(starts))
+    for j in range(len(log_odds)):
+        scores += log_odds[j][codes[starts + j]]
+        alive = scores + suffix_bounds[j + 1] >= threshold - BOUND_TOLERANCE
+        starts = starts[alive]
+        scores = scores[alive]
+        if len(starts) == 0:
+            break
+
+    hits = scores >= threshold
+    return starts[hits], scores[hits]
+
+
+def iter_pwm_hits(encoded_chunks, log_odds: np.ndarray, threshold: float):
+    """
+    Scan consecutive chunks of a sequence on both strands for windows which score at least 'threshold'
+    :param encoded_chunks: an iterable of chunks (bytes) of the sequence encoded by '_SCAN_ENCODE_TABLE'
+    :param log_odds: a table produced by 'log_odds_matrix()'
+    :return: a generator of (position, strand, score) in order of positions ('+' before '-' at the same position).
+    The position is the start of the window on the forward strand; a '-' hit is the reverse complement of the window
+    """
+    k = len(log_odds)
+    strands = []
+    for strand, matrix in (('+', log_odds), ('-', reverse_complement_matrix(log_odds))):
+        strands.append((strand, matrix, _suffix_bounds(matrix)))
+
+    tail = np.zeros(0, dtype=np.uint8)
+    offset = 0
+    for chunk in encoded_chunks:
+        codes = np.concatenate((tail, np.frombuffer(chunk, dtype=np.uint8)))
+        windows = len(codes) - k + 1
+        if windows <= 0:
+            tail = codes
+            continue
+
+        hits = []
+        for strand, matrix, suffix_bounds in strands:
+            starts, scores = _scan_strand(codes, matrix, suffix_bounds, threshold)
+            hits.extend(zip((starts + offset).tolist(), [strand] * len(starts), scores.tolist()))
+        hits.sort()
+        yield from hits
+
+        # The last k - 1 bases start windows which continue into the next chunk
+        tail = codes[windows:]
+        offset += windows
+
+
+def iter_genome_pwm_hits(genome: str, log_odds: np.ndarray, threshold: float):
+    """
+    Scan a genome on both strands, see 'iter_pwm_hits()'
+    """
+    return iter_pwm_hits([genome.encode('ascii').translate(_SCAN_ENCODE_TABLE, _WHITESPACE)], log_odds, threshold)
+
+
+def _iter_encoded_chunks(data, start: int, end: int, chunk_size: int):
+    for pos in range(start, end, chunk_size):
+        yield data[pos:min(pos + chunk_size, end)].translate(_SCAN_ENCODE_TABLE, _WHITESPACE)
+
+
+def _iter_encoded_file_records(path: str, chunk_size: int):
+    """
+    Iterate over records of a FASTA file (or a raw sequence file, which is a single record named None), through mmap
+    :return: a generator of (record name, generator of encoded chunks). Chunks of a record must be consumed before the
+    next record is requested
+    """
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            while pos < len(data):
+                name = None
+                if data[pos] == ord('>'):
+                    header_end = data.find(b'\n', pos)
+                    if header_end == -1:
+                        header_end = len(data)
+                    name = data[pos + 1:header_end].decode().strip()
+                    pos = header_end + 1
+
+                if data[pos:pos + 1] == b'>':
+                    end = pos
+                else:
+                    next_header = data.find(b'\n>', pos)
+                    end = len(data) if next_header == -1 else next_header + 1
+                yield name, _iter_encoded_chunks(data, pos, end, chunk_size)
+                pos = end
+
+
+def iter_file_pwm_hits(path: str, log_odds: np.ndarray, threshold: float, chunk_size: int = SCAN_CHUNK_SIZE):
+    """
+    Scan every record of a FASTA (or raw sequence) file on both strands, 'chunk_size' bytes at a time, see
+    'iter_pwm_hits()'. Windows do not span records; positions start at 0 in every record
+    :return: a generator of (record name, generator of hits of the record). Hits of a record must be consumed before
+    the next record is requested
+    """
+    for name, chunks in _iter_encoded_file_records(path, chunk_size):
+        yield name, iter_pwm_hits(chunks, log_odds, threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,129 +1,68 @@
 #!/usr/bin/env python3
 
-from functools import reduce
-from random import randint
+import argparse
+import sys
+from random import Random, randint
+
+from motif_restarts import restart_seeds, run_restarts, shared_scorer, vote_motifs
+from profile_scoring import MotifProfile, ProfileScorer
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Find motifs by randomized motif search with restarts')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='run restarts in this number of processes (0 means the number of CPUs)'
+    )
+    parser.add_argument('--seed', type=int, help='seed of restarts run in processes, for reproducible results')
+    parser.add_argument('--stats', action='store_true', help='print the number of votes for every motif to stderr')
+    args = parser.parse_args()
+
     k, total_genomes = list(map(int, input().split()))
     genomes = []
     for _ in range(total_genomes):
         genomes.append(input().upper())
 
+    stats = {}
     # best_motifs = randomized_motif_search(k, genomes)
-    best_motifs = summarized_randomized_motif_search(k, genomes, 1000)
+    if args.workers is None:
+        best_motifs = summarized_randomized_motif_search(k, genomes, 1000, stats)
+    else:
+        best_motifs = parallel_randomized_motif_search(
+            k, genomes, 1000, args.workers if args.workers > 0 else None, args.seed, stats
+        )
 
     for motif in best_motifs:
         print(motif)
+    if args.stats:
+        for max_count in stats['max_counts']:
+            print(max_count, file=sys.stderr)
 
 
-ACTG_MAP = {
-    'A': 0,
-    'C': 1,
-    'T': 2,
-    'G': 3,
-}
-
-ACTG_REVERSE_MAP = {
-    0: 'A',
-    1: 'C',
-    2: 'T',
-    3: 'G'
-}
-
-
-def _recount_profile(profile: list, genome: str) -> None:
-    """
-    Include 'genome' into given 'profile' counts matrix
-    """
-    for i in range(len(genome)):
-        profile[i][ACTG_MAP[genome[i]]] += 1
-
-
-def _reform_profile(genomes: list) -> list:
-    """
-    Generate a profile (counts) of the given 'genomes'
-    """
-    result = [[1 for _ in range(4)] for _ in range(len(genomes[0]))]
-    for genome in genomes:
-        _recount_profile(result, genome)
-    return result
-
-
-def _profile_to_probs(profile: list, total_genomes: int) -> list:
-    """
-    Convert a profile (with counts) to a profile of probabilities
-    """
-    result = []
-    for bases in profile:
-        result.append([float(bases[i]) / (float(total_genomes) + 4.) for i in range(4)])
-    return result
-
-
-def _profile_consensus_mer(profile: list) -> str:
-    """
-    Get a consensus mer from the given profile
-    """
-    result = []
-    for bases in profile:
-        min_base = max(range(len(bases)), key=bases.__getitem__)
-        result.append(ACTG_REVERSE_MAP[min_base])
-    return ''.join(result)
-
-
-def _score_mers(mers: list, consensus: str) -> int:
-    """
-    Calculate the score of a mer list
-    """
-    result = 0
-    for mer in mers:
-        for i in range(len(mer)):
-            if mer[i] != consensus[i]:
-                result += 1
-    return result
-
-
-def _profile_most_probable_mer(k: int, profile_probs: list, genome: str) -> str:
-    """
-    Return profile most-probable k-mer
-    """
-    best_mer = None
-    best_probability = None
-    for k_start in range(len(genome) - k + 1):
-        curr_mer = genome[k_start:k_start + k]
-        curr_probability = reduce(
-            lambda x, y: x * y,
-            [profile_probs[i][ACTG_MAP[curr_mer[i]]] for i in range(len(curr_mer))]
-        )
-        if best_probability is None or curr_probability > best_probability:
-            best_mer = curr_mer
-            best_probability = curr_probability
-    return best_mer
-
-
-def randomized_motif_search(k: int, genomes: list) -> list:
+def randomized_motif_search(k: int, genomes: list, rng: Random = None, scorer: ProfileScorer = None) -> list:
     """
     Find profile-best motifs of length 'k' in each of the 'genomes' using a randomized algorithm
+    :param rng: random generator to use; the global one of 'random' module if not given
+    :param scorer: a scorer of 'genomes', if one is already built
     """
+    if scorer is None:
+        scorer = ProfileScorer(genomes)
+    random_int = randint if rng is None else rng.randint
     best_motifs = []
     for genome in genomes:
-        r = randint(0, len(genomes[0]) - k)
+        r = random_int(0, len(genomes[0]) - k)
         best_motifs.append(genome[r:r + k])
-    tmp_profile = _reform_profile(best_motifs)
-    best_motifs_profile_probs = _profile_to_probs(tmp_profile, len(best_motifs))
-    best_motifs_score = _score_mers(best_motifs, _profile_consensus_mer(_profile_to_probs(tmp_profile, len(best_motifs))))
+    best_motifs_profile = MotifProfile.from_motifs(best_motifs)
+    best_motifs_score = best_motifs_profile.score
 
     while True:
-        curr_motifs = []
-        for genome in genomes:
-            most_probable_motif = _profile_most_probable_mer(k, best_motifs_profile_probs, genome)
-            curr_motifs.append(most_probable_motif)
+        curr_motifs = scorer.most_probable_mers(best_motifs_profile.log_profile(1))
 
-        curr_motifs_profile = _reform_profile(curr_motifs)
-        curr_motifs_score = _score_mers(curr_motifs, _profile_consensus_mer(_profile_to_probs(curr_motifs_profile, len(curr_motifs))))
+        curr_motifs_profile = MotifProfile.from_motifs(curr_motifs)
+        curr_motifs_score = curr_motifs_profile.score
         if curr_motifs_score < best_motifs_score:
             best_motifs = curr_motifs
-            best_motifs_profile_probs = _profile_to_probs(curr_motifs_profile, len(curr_motifs))
+            best_motifs_profile = curr_motifs_profile
             best_motifs_score = curr_motifs_score
         else:
             break
@@ -131,30 +70,48 @@ def randomized_motif_search(k: int, genomes: list) -> list:
     return best_motifs
 
 
-def summarized_randomized_motif_search(k: int, genomes: list, n: int) -> list:
+def summarized_randomized_motif_search(k: int, genomes: list, n: int, stats: dict = None) -> list:
     """
     Perform 'randomized_motif_search()' 'N' times
+    :param stats: if given, its 'max_counts' entry is set to the number of votes for the chosen motif of every genome
     """
+    scorer = ProfileScorer(genomes)
     randomized_search_results = []
     for _ in range(n):
-        randomized_search_results.append(randomized_motif_search(k, genomes))
+        randomized_search_results.append(randomized_motif_search(k, genomes, scorer=scorer))
+
+    max_counts = []
+    result = vote_motifs(randomized_search_results, len(genomes), max_counts)
+    if stats is not None:
+        stats['max_counts'] = max_counts
+    return result
 
-    result = []
-    for i in range(len(genomes)):
-        randomized_search_counts = {}
-        randomized_search_max_count = 0
-        randomized_search_max_motif = None
 
-        for search_result in randomized_search_results:
-            count = randomized_search_counts.get(search_result[i], 0) + 1
-            if count > randomized_search_max_count:
-                randomized_search_max_count = count
-                randomized_search_max_motif = search_result[i]
-            randomized_search_counts[search_result[i]] = count
+def _randomized_restarts(task: tuple) -> list:
+    """
+    Run 'randomized_motif_search()' over the shared genomes once per seed of a task ((k,), seeds)
+    """
+    (k,), seeds = task
+    scorer = shared_scorer()
+    return [randomized_motif_search(k, scorer.genomes, Random(seed), scorer) for seed in seeds]
+
 
-        result.append(randomized_search_max_motif)
-        print(randomized_search_max_count)
+def parallel_randomized_motif_search(k: int, genomes: list, n: int, workers: int = None, seed: int = None,
+                                     stats: dict = None) -> list:
+    """
+    Perform 'randomized_motif_search()' 'n' times in a pool of processes, and choose motifs by votes as
+    'summarized_randomized_motif_search()' does. Every restart has its own random generator derived from 'seed', so
+    the result only depends on the seed
+    :param workers: number of processes; the number of CPUs by default
+    :param seed: an integer seed; fresh entropy if None
+    :param stats: if given, its 'max_counts' entry is set to the number of votes for the chosen motif of every genome
+    """
+    results = run_restarts(ProfileScorer(genomes), _randomized_restarts, restart_seeds(seed, n), (k,), workers)
 
+    max_counts = []
+    result = vote_motifs(results, len(genomes), max_counts)
+    if stats is not None:
+        stats['max_counts'] = max_counts
     return result
 
 